@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 import tomllib
@@ -16,6 +17,7 @@ from routes.recent_route import router as recent_router
 from routes.ignore_route import router as ignore_router
 from routes.spotify_streaming import router as streaming_router
 from services import Spotify
+from services.spotify_history import resume_pending_imports, shutdown_import_pool
 from settings import PROJECT_PATH
 from starlette.middleware import Middleware
 from starlette.middleware.sessions import SessionMiddleware
@@ -60,7 +62,11 @@ async def app_lifespan(app: FastAPI):
     update_database()
     spotify = Spotify()
     app.state.spotify = spotify
+    if not settings.TESTING_MODE and not settings.HISTORY_IMPORT_WORKER:
+        # keep a reference, so the resuming task isn't garbage collected
+        app.state.resume_imports = asyncio.create_task(resume_pending_imports())
     yield
+    shutdown_import_pool()
     await spotify.close()
     logger.debug("Closing app")
 
@@ -0,0 +1,46 @@
+"""history uploads
+
+Revision ID: 9b3f6a1d2e70
+Revises: 4ec607b432b8
+Create Date: 2026-10-16 11:04:52.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+import models
+
+
+# revision identifiers, used by Alembic.
+revision = "9b3f6a1d2e70"
+down_revision = "4ec607b432b8"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "history_uploads",
+        sa.Column("user_id", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("sha256", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column(
+            "created_at", models.types.UtcAwareDateTime(timezone=True), nullable=False
+        ),
+        sa.Column(
+            "processed_at", models.types.UtcAwareDateTime(timezone=True), nullable=True
+        ),
+        sa.Column(
+            "started_at", models.types.UtcAwareDateTime(timezone=True), nullable=True
+        ),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["user_id"],
+            ["users.id"],
+        ),
+        sa.PrimaryKeyConstraint("user_id", "sha256"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("history_uploads")
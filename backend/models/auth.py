@@ -1,11 +1,12 @@
 """Authentication models"""
 
 import datetime
+import hashlib
 import re
 from enum import Enum
 from typing import Any
 
-from sqlalchemy import func
+from sqlalchemy import delete, func
 from sqlmodel import SQLModel, Field, Column, JSON, Session, select
 from .common import CamelModel
 from .types import UtcAwareDateTime  # adjust import as needed
@@ -64,7 +65,14 @@ class User(SQLModel, CamelModel, table=True):
         return self.email
 
 
-def populate_username(db_session: Session, user: User) -> str:
+def populate_username(
+    db_session: Session, user: User, taken: set[str] | None = None
+) -> str:
+    """Give the user a unique username derived from their name or email.
+
+    Pass the set of the usernames already taken when naming users in bulk:
+    it's checked (and updated) instead of querying the DB for each candidate.
+    """
     # Extract base username from name or email
     base_username = ""
 
@@ -91,9 +99,12 @@ def populate_username(db_session: Session, user: User) -> str:
 
     while True:
         # Check if username already exists
-        existing_user = db_session.exec(
-            select(User).where(User.username == candidate)
-        ).first()
+        if taken is not None:
+            existing_user = candidate in taken
+        else:
+            existing_user = db_session.exec(
+                select(User).where(User.username == candidate)
+            ).first()
 
         if not existing_user:
             break
@@ -104,10 +115,15 @@ def populate_username(db_session: Session, user: User) -> str:
     # Update the user with the new username
     user.username = candidate
     db_session.add(user)
+    if taken is not None:
+        taken.add(candidate)
 
     return candidate
 
 
+OAUTH_STATE_TTL = datetime.timedelta(minutes=10)
+
+
 class OAuthState(SQLModel, CamelModel, table=True):
     """Single-use OAuth state to prevent CSRF and enable auditing.
 
@@ -133,7 +149,7 @@ class OAuthState(SQLModel, CamelModel, table=True):
     )
     expires_at: datetime.datetime = Field(
         default_factory=lambda: datetime.datetime.now(datetime.timezone.utc)
-        + datetime.timedelta(minutes=10),
+        + OAUTH_STATE_TTL,
         sa_column=Column(UtcAwareDateTime(), nullable=False),
     )
     consumed_at: datetime.datetime | None = Field(
@@ -155,3 +171,22 @@ class OAuthState(SQLModel, CamelModel, table=True):
 
     # The user that completed the handshake (set on successful callback)
     user_id: str | None = Field(default=None, foreign_key="users.id", index=True)
+
+
+def hash_oauth_state(state: str) -> str:
+    """The digest we persist in OAuthState.state_hash for a raw state token.
+
+    Just a lookup key (the state itself is the secret): BLAKE2b is faster than
+    SHA-256 on short inputs, 32 bytes keep the same 64-char hex column.
+    """
+    return hashlib.blake2b(state.encode(), digest_size=32).hexdigest()
+
+
+def purge_expired_oauth_states(
+    db_session: Session, older_than: datetime.timedelta = datetime.timedelta(days=1)
+) -> int:
+    """Delete the OAuth states expired for more than `older_than`, return how many"""
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - older_than
+    # exec hands back the Core result, with its rowcount
+    result = db_session.exec(delete(OAuthState).where(OAuthState.expires_at < cutoff))
+    return result.rowcount
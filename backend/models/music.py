@@ -181,3 +181,26 @@ class GlobalIgnoredArtist(SQLModel, CamelModel, table=True):
     )
 
     __table_args__ = (Index("idx_global_ignored_artists_artist", "artist_id"),)
+
+
+class HistoryUpload(SQLModel, CamelModel, table=True):
+    """Extended streaming history ZIPs a user uploaded, keyed by content hash"""
+
+    __tablename__ = "history_uploads"
+
+    user_id: str = Field(primary_key=True, foreign_key="users.id")
+    sha256: str = Field(primary_key=True)
+    created_at: datetime.datetime = Field(
+        default_factory=lambda: datetime.datetime.now(timezone.utc),
+        sa_column=Column(UtcAwareDateTime(), nullable=False),
+    )
+    processed_at: datetime.datetime | None = Field(
+        default=None,
+        sa_column=Column(UtcAwareDateTime(), nullable=True),
+    )
+    # claimed by the process importing it, see claim_history_upload
+    started_at: datetime.datetime | None = Field(
+        default=None,
+        sa_column=Column(UtcAwareDateTime(), nullable=True),
+    )
+    attempts: int = Field(default=0)
@@ -1,5 +1,6 @@
 from datetime import datetime, timedelta, timezone
 
+from expiringdict import ExpiringDict
 from fastapi import Depends, Request, HTTPException
 from models.auth import User
 from models.common import get_session
@@ -25,6 +26,25 @@ def current_user(user: User = Depends(get_current_user)) -> User:
     return user
 
 
+class RateLimiter:
+    """Fixed-window rate limit per client IP, to be used as a route dependency"""
+
+    def __init__(self, times: int, seconds: int):
+        self.times = times
+        # the window starts at the first hit: counters are mutated in place,
+        # so the expiry isn't pushed forward by later hits
+        self.hits = ExpiringDict(max_len=10_000, max_age_seconds=seconds)
+
+    def __call__(self, request: Request) -> None:
+        client_ip = request.client.host if request.client else None
+        counter = self.hits.get(client_ip)
+        if counter is None:
+            counter = self.hits[client_ip] = [0]
+        counter[0] += 1
+        if counter[0] > self.times:
+            raise HTTPException(status_code=429, detail="Too many requests")
+
+
 def parse_ui_date(before: str | None) -> datetime | None:
     if not before:
         return None
@@ -237,8 +237,11 @@ async def toggle_like(
         if not existing_like:
             session.add(Like(user_id=current_user.id, track_id=track_id, date=now))
             session.commit()
-            if current_user.id in cache.likes_cache:  # manually update the cache
-                cache.likes_cache[current_user.id].add(track_id)
+            # manually update the cache (the cached likes are immutable)
+            likes = cache.likes_cache.get(current_user.id)
+            if likes is not None:
+                cache.likes_cache[current_user.id] = likes | {track_id}
+            cache.invalidate_stats(current_user.id)
         await spotify.set_liked_track(
             user=current_user,
             db_session=session,
@@ -251,8 +254,11 @@ async def toggle_like(
         if existing_like:
             session.delete(existing_like)
             session.commit()
-            if current_user.id in cache.likes_cache:  # manually update the cache
-                cache.likes_cache[current_user.id].remove(track_id)
+            # manually update the cache (the cached likes are immutable)
+            likes = cache.likes_cache.get(current_user.id)
+            if likes is not None:
+                cache.likes_cache[current_user.id] = likes - {track_id}
+            cache.invalidate_stats(current_user.id)
         await spotify.set_liked_track(
             user=current_user, db_session=session, track_id=track_id, liked=False
         )
@@ -1,6 +1,9 @@
+import asyncio
 import datetime
-import os
 import hashlib
+import os
+from pathlib import Path
+from typing import BinaryIO
 
 from fastapi import (
     APIRouter,
@@ -13,27 +16,42 @@ from fastapi import (
     BackgroundTasks,
 )
 from fastapi.responses import RedirectResponse
-from sqlmodel import Session, select, func
+from sqlmodel import Session, select, func, insert, update
 import tempfile
 import zipfile
-from pathlib import Path
 import logging
 
 import settings
-from models.auth import User, populate_username, OAuthState, App
+from models.auth import (
+    OAUTH_STATE_TTL,
+    User,
+    populate_username,
+    OAuthState,
+    App,
+    hash_oauth_state,
+)
 from models.common import get_session
-from models.music import Like, Play
-from routes.deps import current_user
+from models.music import HistoryUpload, Like, Play
+from routes.deps import RateLimiter, current_user
+from services.cache import cache
 from services.slack import slack
 from services.spotify import get_spotify_client, Spotify
-from services.spotify_history import process_spotify_history_zip
+from services.spotify_history import history_upload_path, process_spotify_history_zip
 
 logger = logging.getLogger("lykd.spotify_import")
 
 router = APIRouter()
 
+UPLOAD_COPY_BUFFER_SIZE = 8 * 1024 * 1024
+# local file header, empty archive, spanned archive
+ZIP_MAGIC_NUMBERS = (b"PK\x03\x04", b"PK\x05\x06", b"PK\x07\x08")
+
 
-@router.get("/spotify/authorize")
+# every authorize call stores an OAuthState, keep anonymous clients in check
+authorize_rate_limit = RateLimiter(times=10, seconds=60)
+
+
+@router.get("/spotify/authorize", dependencies=[Depends(authorize_rate_limit)])
 async def spotify_authorize(
     request: Request,
     next: str | None = Query(None, description="Optional next URL after login"),
@@ -43,21 +61,28 @@ async def spotify_authorize(
     auth_url, state = spotify.get_authorization_url()
 
     # Persist single-use state with client metadata for validation/auditing
-    state_hash = hashlib.sha256(state.encode("utf-8")).hexdigest()
+    state_hash = hash_oauth_state(state)
     client_ip = request.client.host if request.client else None
     ua = request.headers.get("user-agent")
     referer = request.headers.get("referer")
 
-    oauth_state = OAuthState(
-        provider="spotify",
-        state_hash=state_hash,
-        request_ip=client_ip,
-        request_user_agent=ua,
-        request_referer=referer,
-        redirect_uri=spotify.redirect_uri,
-        next_url=next,
+    # Core insert: no ORM unit-of-work for a write-only row, so the model's
+    # Python-side defaults have to be given explicitly
+    now = datetime.datetime.now(datetime.timezone.utc)
+    db.exec(
+        insert(OAuthState).values(
+            provider="spotify",
+            state_hash=state_hash,
+            created_at=now,
+            expires_at=now + OAUTH_STATE_TTL,
+            attempt_count=0,
+            request_ip=client_ip,
+            request_user_agent=ua,
+            request_referer=referer,
+            redirect_uri=spotify.redirect_uri,
+            next_url=next,
+        )
     )
-    db.add(oauth_state)
     db.commit()
 
     return {"authorization_url": auth_url, "state": state}
@@ -66,6 +91,7 @@ async def spotify_authorize(
 @router.get("/spotify/callback")
 async def spotify_callback(
     request: Request,
+    background_tasks: BackgroundTasks,
     code: str | None = Query(None, description="Authorization code from Spotify"),
     state: str | None = Query(..., description="State parameter for security"),
     error: str | None = Query(None, description="Error from Spotify OAuth"),
@@ -86,30 +112,23 @@ async def spotify_callback(
                 status_code=302,
             )
 
-        state_hash = hashlib.sha256(state.encode("utf-8")).hexdigest()
+        state_hash = hash_oauth_state(state)
         now = datetime.datetime.now(datetime.timezone.utc)
         client_ip = request.client.host if request.client else None
 
-        # Look up the state using SQLModel and consume it
-        oauth_state = session.exec(
-            select(OAuthState).where(
-                OAuthState.provider == "spotify",
-                OAuthState.state_hash == state_hash,
-                OAuthState.consumed_at.is_(None),
-                OAuthState.expires_at > now,
-            )
-        ).one_or_none()
+        # Consume the state with a single compare-and-set UPDATE, returning
+        # just its id: no need to load the whole row
+        # the Core result, for the RETURNING id
+        oauth_state_id = session.exec(
+            build_consume_state_stmt(state_hash, now, client_ip)
+        ).scalar_one_or_none()
 
-        if not oauth_state:
+        if oauth_state_id is None:
+            session.rollback()
             return RedirectResponse(
                 url=f"{settings.BASE_URL}/error?message=Invalid or expired state",
                 status_code=302,
             )
-
-        oauth_state.consumed_at = now
-        oauth_state.consumed_by_ip = client_ip
-        oauth_state.attempt_count = (oauth_state.attempt_count or 0) + 1
-        session.add(oauth_state)
         session.commit()
 
         token_data = await spotify.exchange_code_for_token(code)
@@ -125,7 +144,9 @@ async def spotify_callback(
             )
             existing_user.subscribed = user_info["product"] == "premium"
             if existing_user.app_name != "lykd":
-                slack.send_message(f"📈 User migrated to LYKD: {existing_user}")
+                background_tasks.add_task(
+                    slack.send_message, f"📈 User migrated to LYKD: {existing_user}"
+                )
                 existing_user.app_name = (
                     App.lykd
                 )  # Migrate any existing user to lykd app
@@ -152,12 +173,17 @@ async def spotify_callback(
             )
             populate_username(session, user)
             session.add(user)
-            slack.send_message(f"🐣New user connected to Spotify: {user}")
-
-        # Link the oauth_state to the user who completed the handshake
-        oauth_state.user_id = user.id
-        session.add(oauth_state)
+            background_tasks.add_task(
+                slack.send_message, f"🐣New user connected to Spotify: {user}"
+            )
 
+        # Link the oauth_state to the user who completed the handshake, in the
+        # same commit as the user
+        session.exec(
+            update(OAuthState)
+            .where(OAuthState.id == oauth_state_id)
+            .values(user_id=user.id)
+        )
         session.commit()
         request.session["user_id"] = user.id
         return RedirectResponse(
@@ -176,27 +202,16 @@ async def spotify_callback(
 
 
 @router.get("/spotify/stats")
-async def get_spotify_stats(
+def get_spotify_stats(
     user: User = Depends(current_user),
     session: Session = Depends(get_session),
 ):
     """Get Spotify sync statistics for the current user"""
-
-    total_likes = session.exec(
-        select(func.count(Like.track_id)).where(Like.user_id == user.id)
-    ).one()
-    total_plays = session.exec(
-        select(func.count(Play.track_id)).where(Play.user_id == user.id)
-    ).one()
-
-    # Get the earliest like date (tracking since)
-    earliest_like_date = session.exec(
-        select(func.min(Play.date)).where(Play.user_id == user.id)
-    ).one()
-
-    tracking_since = None
-    if earliest_like_date:
-        tracking_since = earliest_like_date.isoformat()
+    stats = cache.stats_cache.get(user.id)
+    if stats is None:
+        stats = compute_spotify_stats(user, session)
+        cache.stats_cache[user.id] = stats
+    total_likes, total_plays, tracking_since = stats
 
     return {
         "total_likes_synced": total_likes,
@@ -208,6 +223,70 @@ async def get_spotify_stats(
     }
 
 
+def build_spotify_stats_stmt(user_id: str):
+    # Likes count, play count and earliest play date (tracking since) in one
+    # round-trip: count(*) on likes is answered by the (user_id, track_id)
+    # primary key, count and min on plays by idx_plays_user_date
+    return select(
+        select(func.count())
+        .select_from(Like)
+        .where(Like.user_id == user_id)
+        .scalar_subquery(),
+        select(func.count())
+        .select_from(Play)
+        .where(Play.user_id == user_id)
+        .scalar_subquery(),
+        select(func.min(Play.date)).where(Play.user_id == user_id).scalar_subquery(),
+    )
+
+
+def build_consume_state_stmt(
+    state_hash: str, now: datetime.datetime, client_ip: str | None
+):
+    # Compare-and-set: only one concurrent callback can flip consumed_at
+    return (
+        update(OAuthState)
+        .where(
+            OAuthState.provider == "spotify",
+            OAuthState.state_hash == state_hash,
+            OAuthState.consumed_at.is_(None),
+            OAuthState.expires_at > now,
+        )
+        .values(
+            consumed_at=now,
+            consumed_by_ip=client_ip,
+            attempt_count=func.coalesce(OAuthState.attempt_count, 0) + 1,
+        )
+        .returning(OAuthState.id)
+    )
+
+
+def compute_spotify_stats(user: User, session: Session) -> tuple[int, int, str | None]:
+    """Likes count, plays count and the earliest play date for the user"""
+    total_likes, total_plays, earliest_play_date = session.exec(
+        build_spotify_stats_stmt(user.id)
+    ).one()
+
+    tracking_since = None
+    if earliest_play_date:
+        tracking_since = earliest_play_date.isoformat()
+    return total_likes, total_plays, tracking_since
+
+
+def save_upload(src: BinaryIO, out: BinaryIO) -> str:
+    """Copy the uploaded file to `out` in large blocks, and rewind it.
+
+    Returns the SHA-256 hex digest of the content, computed while copying.
+    """
+    digest = hashlib.sha256()
+    src.seek(0)
+    while chunk := src.read(UPLOAD_COPY_BUFFER_SIZE):
+        digest.update(chunk)
+        out.write(chunk)
+    out.seek(0)
+    return digest.hexdigest()
+
+
 def get_history_sync_seconds_wait(current_user: User) -> int:
     """How long the user should wait before syncing history again."""
     if not current_user.last_history_sync:
@@ -240,42 +319,60 @@ async def import_spotify_extended_history(
 
     if not file.filename:
         raise HTTPException(status_code=400, detail="Missing file")
-    # Persist upload to a temp file first
-    fd, tmp_zip = tempfile.mkstemp(prefix="lykd_spotify_zip_", suffix=".zip")
-    with os.fdopen(fd, "wb") as out:
-        while True:
-            chunk = await file.read(1024 * 1024)
-            if not chunk:
-                break
-            out.write(chunk)
-    await file.close()
-
-    # Validate ZIP signature before scheduling background work
+    # Cheap signature check on the first bytes, before anything hits the disk
+    magic = await file.read(4)
+    if magic not in ZIP_MAGIC_NUMBERS:
+        await file.close()
+        raise HTTPException(status_code=400, detail="Please upload a valid ZIP file")
+
+    # Stream the upload next to the pending imports, hashing it on the way:
+    # once accepted it's renamed in place, never written again
+    settings.HISTORY_IMPORTS_DIR.mkdir(parents=True, exist_ok=True)
+    upload = tempfile.NamedTemporaryFile(
+        dir=settings.HISTORY_IMPORTS_DIR, prefix="upload_", suffix=".part", delete=False
+    )
+    upload_path = Path(upload.name)
     try:
-        if not zipfile.is_zipfile(tmp_zip):
+        with upload:
+            upload_sha256 = await asyncio.to_thread(save_upload, file.file, upload)
+            await file.close()
+
+            # Validate the ZIP central directory before scheduling background work
             try:
-                Path(tmp_zip).unlink(missing_ok=True)
+                valid_zip = zipfile.is_zipfile(upload)
             except Exception:
-                pass
+                valid_zip = False
+        if not valid_zip:
             raise HTTPException(
                 status_code=400, detail="Please upload a valid ZIP file"
             )
-    except HTTPException:
-        raise
-    except Exception:
-        try:
-            Path(tmp_zip).unlink(missing_ok=True)
-        except Exception:
-            pass
-        raise HTTPException(status_code=400, detail="Please upload a valid ZIP file")
 
-    # mark the user as having started a history sync
-    user.last_history_sync = datetime.datetime.now(datetime.timezone.utc)
-    session.add(user)
+        # The very same ZIP was already imported: nothing new to process
+        history_upload = session.get(HistoryUpload, (user.id, upload_sha256))
+        if history_upload and history_upload.processed_at:
+            return {"message": "Already imported"}
+        if not history_upload:
+            session.add(HistoryUpload(user_id=user.id, sha256=upload_sha256))
+
+        # mark the user as having started a history sync
+        user.last_history_sync = datetime.datetime.now(datetime.timezone.utc)
+        session.add(user)
+
+        # Keep the ZIP on disk until it's imported, so a restart can resume the job
+        zip_path = history_upload_path(user.id, upload_sha256)
+        os.replace(upload_path, zip_path)
+    finally:
+        upload_path.unlink(missing_ok=True)
     session.commit()
+    cache.invalidate_stats(user.id)
 
-    # Schedule background processing
-    background_tasks.add_task(process_spotify_history_zip, user, tmp_zip)
-    slack.send_message(f"⏳ User {user} processed the full history")
+    # Schedule background processing, unless the import worker picks it up
+    if not settings.HISTORY_IMPORT_WORKER:
+        background_tasks.add_task(
+            process_spotify_history_zip, user, str(zip_path), upload_sha256
+        )
+    background_tasks.add_task(
+        slack.send_message, f"⏳ User {user} processed the full history"
+    )
 
     return {"message": "Import started"}
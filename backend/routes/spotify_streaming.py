@@ -1,4 +1,7 @@
+import asyncio
+
 from fastapi import Depends, HTTPException, APIRouter
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from sqlmodel import Session
 
@@ -22,6 +25,33 @@ class TransferRequest(BaseModel):
     play: bool | None = True
 
 
+async def get_track_payload(
+    spotify: Spotify, user: User, db: Session, track_id: str
+) -> dict | None:
+    """The track details shown by the player, None when they can't be fetched"""
+    track_payload = cache.spotify_track_cache.get(track_id)
+    if track_payload is not None:
+        return track_payload
+    try:
+        t = await spotify.get_track(user=user, db_session=db, track_id=track_id)
+        artists = [
+            a.get("name") for a in (t.get("artists") or []) if a and a.get("name")
+        ]
+        images = (t.get("album") or {}).get("images") or []
+        album_image = images[0]["url"] if images else None
+        track_payload = {
+            "id": t.get("id"),
+            "name": t.get("name"),
+            "artists": artists,
+            "album_image": album_image,
+            "duration_ms": t.get("duration_ms") or 0,
+        }
+    except Exception:
+        return None
+    cache.spotify_track_cache[track_id] = track_payload
+    return track_payload
+
+
 @router.post("/spotify/play")
 async def spotify_play(
     body: PlayRequest,
@@ -29,9 +59,13 @@ async def spotify_play(
     spotify: Spotify = Depends(get_spotify_client),
     db: Session = Depends(get_session),
 ):
-    # Start playback; if it succeeds, also return track details for immediate UI update
+    # Start playback and fetch the track details (for immediate UI update)
+    # concurrently: the lookup doesn't depend on playback starting
     try:
-        await spotify.play(user=user, db_session=db, uris=[body.track_id])
+        _, track_payload = await asyncio.gather(
+            spotify.play(user=user, db_session=db, uris=[body.track_id]),
+            get_track_payload(spotify, user, db, body.track_id),
+        )
     except HTTPException as e:
         if e.status_code == 404 and "No active device" in (e.detail or ""):
             raise HTTPException(
@@ -40,24 +74,6 @@ async def spotify_play(
             )
         raise
 
-    # Fetch track details for immediate display
-    try:
-        t = await spotify.get_track(user=user, db_session=db, track_id=body.track_id)
-        artists = [
-            a.get("name") for a in (t.get("artists") or []) if a and a.get("name")
-        ]
-        images = (t.get("album") or {}).get("images") or []
-        album_image = images[0]["url"] if images else None
-        track_payload = {
-            "id": t.get("id"),
-            "name": t.get("name"),
-            "artists": artists,
-            "album_image": album_image,
-            "duration_ms": t.get("duration_ms") or 0,
-        }
-    except Exception:
-        track_payload = None
-
     return {"status": "ok", "track": track_payload}
 
 
@@ -112,8 +128,9 @@ async def spotify_playback(
     db: Session = Depends(get_session),
 ):
     state = await spotify.get_playback_state(user=user, db_session=db)
-    # Return minimal info (pass-through for now)
-    return {"state": state}
+    # Return minimal info (pass-through for now): the state is Spotify's
+    # decoded JSON already, so skip the jsonable_encoder walk on every poll
+    return JSONResponse({"state": state})
 
 
 @router.get("/spotify/token")
@@ -157,7 +174,7 @@ async def spotify_transfer(
 
 
 @router.get("/track/{track_id}/like")
-async def get_track_like(
+def get_track_like(
     track_id: str,
     user: User = Depends(current_user),
     db: Session = Depends(get_session),
@@ -4,6 +4,8 @@
 import setproctitle
 import uvicorn
 
+import settings
+
 setproctitle.setproctitle("Lykd API")
 
 if __name__ == "__main__":  # pragma: no cover
@@ -13,7 +15,11 @@ if __name__ == "__main__":  # pragma: no cover
         host="127.0.0.1",
         port=3626,
         reload=False,
-        workers=2,
+        workers=settings.API_WORKERS,
+        # both ship with uvicorn[standard]: fail loudly rather than silently
+        # falling back to asyncio's loop and h11
+        loop="uvloop",
+        http="httptools",
         log_level="info",
         proxy_headers=True,
     )
@@ -3,11 +3,16 @@
 import argparse
 import asyncio
 import logging
+import sys
 
-from models.auth import User
+import settings
+from models.auth import User, purge_expired_oauth_states
 from models.common import get_db
 from services import Spotify
+from services.spotify import new_http_client
 from services.likes import process_user
+from sqlalchemy import String, cast
+from sqlalchemy.exc import OperationalError
 from sqlmodel import select
 
 from utils import setup_logs, time_it
@@ -15,8 +20,20 @@ from utils import setup_logs, time_it
 logger = logging.getLogger("lykd.fetch")
 
 
+def build_active_users_stmt():
+    """Users with Spotify tokens, filtered by the DB rather than in Python.
+
+    A JSON column stores None as the JSON 'null' (not as SQL NULL), so compare
+    its text as well to skip both missing and emptied tokens.
+    """
+    return select(User).where(
+        User.tokens.is_not(None),
+        cast(User.tokens, String).not_in(("null", "{}")),
+    )
+
+
 @time_it
-async def fetch_all(max_concurrency: int = 3):
+async def fetch_all(max_concurrency: int = settings.FETCH_CONCURRENCY):
     """Main function to fetch liked songs for all users
 
     Args:
@@ -31,16 +48,16 @@ async def fetch_all(max_concurrency: int = 3):
         max_concurrency = 1
 
     # Get database session and fetch all users
-
+    # raised once out of get_db, which would log and swallow it
+    database_error: OperationalError | None = None
     with get_db() as session:
-        spotify_lykd = Spotify(app_name="lykd")
-        spotify_spotlike = Spotify(app_name="spotlike")
-        users = session.exec(select(User)).all()
-
-        logger.debug(f"Found {len(users)} users in the database")
+        # Housekeeping: keep the OAuth states table (and its indexes) small
+        purged = purge_expired_oauth_states(session)
+        session.commit()
+        logger.debug(f"Purged {purged} expired OAuth states")
 
-        # Filter users that have Spotify tokens
-        active_users = [user for user in users if user.tokens]
+        active_users = session.exec(build_active_users_stmt()).all()
+        logger.debug(f"Found {len(active_users)} users with Spotify tokens")
 
         if not active_users:
             logger.info("No active users found.")
@@ -48,32 +65,54 @@ async def fetch_all(max_concurrency: int = 3):
 
         logger.info(f"Processing {len(active_users)} users...")
 
-        # Bounded concurrency semaphore
-        sem = asyncio.Semaphore(max_concurrency)
-
-        async def _process_user_bounded(user: User):
-            async with sem:
-                spotify_client = (
-                    spotify_lykd if user.app_name == "lykd" else spotify_spotlike
-                )
-                return await process_user(session, user, spotify_client)
-
-        # Execute user processing with bounded concurrency
-        tasks = [_process_user_bounded(user) for user in active_users]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-
-        # Process results and handle any exceptions
-        for i, result in enumerate(results):
-            if isinstance(result, Exception):
-                logger.error(f"Error processing user {active_users[i]}: {result}")
-
-        # Commit any token updates
-        session.commit()
-        await spotify_lykd.close()
-        await spotify_spotlike.close()
-        logger.info(f"Spotify API calls made by Spotlike: {spotify_spotlike.api_usage}")
-        logger.info(f"Spotify API calls made by LYKD: {spotify_lykd.api_usage}")
-
+        # Both apps talk to the same hosts: share one connection pool
+        http_client = new_http_client()
+        spotify_lykd = Spotify(app_name="lykd", client=http_client)
+        spotify_spotlike = Spotify(app_name="spotlike", client=http_client)
+
+        try:
+            # Bounded pipeline: max_concurrency workers draining a queue of users,
+            # instead of one coroutine per user
+            queue: asyncio.Queue[User] = asyncio.Queue()
+            for user in active_users:
+                queue.put_nowait(user)
+
+            async def _worker():
+                while not queue.empty():
+                    user = queue.get_nowait()
+                    spotify_client = (
+                        spotify_lykd if user.app_name == "lykd" else spotify_spotlike
+                    )
+                    try:
+                        await process_user(session, user, spotify_client)
+                    except OperationalError:
+                        # the DB is unusable (locked, gone, disk full...): every
+                        # other user would fail the same way, stop the run
+                        raise
+                    except Exception as e:
+                        # report right away, don't hold on to the failures
+                        logger.error(f"Error processing user {user}: {e}")
+
+            # a fatal error in a worker cancels the others
+            try:
+                async with asyncio.TaskGroup() as tg:
+                    for _ in range(min(max_concurrency, len(active_users))):
+                        tg.create_task(_worker())
+            except* OperationalError as errors:
+                database_error = errors.exceptions[0]
+                logger.error(f"Stopping the run, database error: {database_error}")
+            else:
+                # Commit any token updates
+                session.commit()
+        finally:
+            await http_client.aclose()
+            logger.info(
+                f"Spotify API calls made by Spotlike: {spotify_spotlike.api_usage}"
+            )
+            logger.info(f"Spotify API calls made by LYKD: {spotify_lykd.api_usage}")
+
+    if database_error:
+        raise database_error
     logger.info("Finished processing all users.")
 
 
@@ -87,9 +126,13 @@ if __name__ == "__main__":  # pragma no cover
         "-c",
         "--max-concurrency",
         type=int,
-        default=3,
-        help="Maximum number of users to process concurrently (default: 3)",
+        default=settings.FETCH_CONCURRENCY,
+        help="Maximum number of users to process concurrently "
+        f"(default: $FETCH_CONCURRENCY, {settings.FETCH_CONCURRENCY})",
     )
     args = parser.parse_args()
 
-    asyncio.run(fetch_all(args.max_concurrency))
+    try:
+        asyncio.run(fetch_all(args.max_concurrency))
+    except OperationalError:
+        sys.exit(1)  # already logged, let the scheduler see the failed run
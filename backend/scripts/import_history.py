@@ -0,0 +1,54 @@
+"""Worker importing the uploaded Spotify extended histories
+
+Run it next to the API with HISTORY_IMPORT_WORKER=true: the API then only
+stores the accepted ZIPs, and the imports don't compete with the HTTP traffic.
+"""
+
+import argparse
+import asyncio
+import logging
+
+from services.spotify_history import resume_pending_imports, shutdown_import_pool
+from utils import setup_logs
+
+logger = logging.getLogger("lykd.import_worker")
+
+
+async def run_worker(poll_seconds: int, once: bool = False):
+    """Import the pending uploads, then keep polling for new ones"""
+    while True:
+        try:
+            await resume_pending_imports()
+        except Exception:
+            # keep polling: the next round retries what's still pending
+            logger.exception("Error importing the pending uploads")
+        if once:
+            return
+        await asyncio.sleep(poll_seconds)
+
+
+if __name__ == "__main__":  # pragma no cover
+    setup_logs()
+
+    parser = argparse.ArgumentParser(
+        description="Import the uploaded Spotify extended histories"
+    )
+    parser.add_argument(
+        "-p",
+        "--poll-seconds",
+        type=int,
+        default=10,
+        help="Seconds between checks for new uploads (default: 10)",
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Import what's pending and exit",
+    )
+    args = parser.parse_args()
+
+    logger.info("Starting the history import worker")
+    try:
+        asyncio.run(run_worker(args.poll_seconds, once=args.once))
+    finally:
+        shutdown_import_pool()
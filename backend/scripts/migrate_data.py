@@ -5,17 +5,30 @@ Handles table name changes: album_artist -> albumartist, track_artist -> trackar
 Uses SQLModel throughout to avoid database locking issues.
 """
 
+import logging
 import sys
+from pathlib import Path
 from typing import Any, Dict, List
 
 import settings
 from models.auth import User, populate_username
+from sqlalchemy import Engine, event
 from sqlmodel import Session, create_engine, select, text
 
+from utils import setup_logs
 
-def get_table_info_sqlmodel(session: Session, table_name: str) -> List[Dict[str, Any]]:
+logger = logging.getLogger("lykd.migrate")
+SOURCE_SCHEMA = "src"  # the source DB is attached to the destination connection
+# plays are duplicates when the same user played the same track the same day
+PLAYS_DEDUP_KEY = "user_id, track_id, DATE(date)"
+USERNAMES_PROGRESS_EVERY = 1000
+
+
+def get_table_info_sqlmodel(
+    session: Session, table_name: str, schema: str = "main"
+) -> List[Dict[str, Any]]:
     """Get table info using SQLModel session"""
-    result = session.exec(text(f"PRAGMA table_info({table_name})"))
+    result = session.exec(text(f"PRAGMA {schema}.table_info({table_name})"))
     return [
         {
             "cid": row[0],
@@ -29,55 +42,67 @@ def get_table_info_sqlmodel(session: Session, table_name: str) -> List[Dict[str,
     ]
 
 
-def get_table_columns_sqlmodel(session: Session, table_name: str) -> List[str]:
+def get_table_columns_sqlmodel(
+    session: Session, table_name: str, schema: str = "main"
+) -> List[str]:
     """Get column names for a table using SQLModel session"""
-    table_info = get_table_info_sqlmodel(session, table_name)
+    table_info = get_table_info_sqlmodel(session, table_name, schema)
     return [col["name"] for col in table_info]
 
 
-def get_pk_columns_sqlmodel(session: Session, table_name: str) -> List[str]:
+def pk_columns_from_info(info: List[Dict[str, Any]]) -> List[str]:
     """Return primary key column names ordered by PK sequence (SQLite's pk>0)."""
-    info = get_table_info_sqlmodel(session, table_name)
     pk_cols = [(col["pk"], col["name"]) for col in info if col["pk"]]
     pk_cols.sort(key=lambda x: x[0])
     return [name for _, name in pk_cols]
 
 
 def copy_table_data_sqlmodel(
-    source_session: Session, dest_session: Session, source_table: str, dest_table: str
+    dest_session: Session,
+    source_table: str,
+    dest_table: str,
+    dedup_by: str | None = None,
 ):
-    """Copy data from source table to destination table using SQLModel.
+    """Copy data from the attached source table to the destination table.
     Preserves destination-only columns by using UPSERT that updates only common, non-PK columns.
+    The rows are copied by SQLite itself (INSERT ... SELECT), they never go through Python.
+    With dedup_by (a GROUP BY-like expression) only the first source row of each group is copied.
     """
-    print(f"Copying data from {source_table} to {dest_table}...")
+    logger.info(f"Copying data from {source_table} to {dest_table}...")
 
     # Get columns and PKs
-    source_columns = get_table_columns_sqlmodel(source_session, source_table)
-    dest_columns = get_table_columns_sqlmodel(dest_session, dest_table)
-    pk_columns = get_pk_columns_sqlmodel(dest_session, dest_table)
+    source_columns = get_table_columns_sqlmodel(
+        dest_session, source_table, SOURCE_SCHEMA
+    )
+    # one PRAGMA for both the destination columns and its PK
+    dest_info = get_table_info_sqlmodel(dest_session, dest_table)
+    dest_columns = [col["name"] for col in dest_info]
+    pk_columns = pk_columns_from_info(dest_info)
 
     # Use common columns
     common_columns = [col for col in source_columns if col in dest_columns]
     columns_str = ", ".join(common_columns)
 
-    print(f"  Common columns: {common_columns}")
-    print(f"  PK columns: {pk_columns}")
+    logger.debug(f"  Common columns: {common_columns}")
+    logger.debug(f"  PK columns: {pk_columns}")
 
     if not common_columns:
-        print(f"  No common columns found between {source_table} and {dest_table}")
-        return
-
-    # Get all data from source table
-    source_query = text(f"SELECT {columns_str} FROM {source_table}")  # nosec B608
-    result = source_session.exec(source_query)
-    rows = result.fetchall()
-
-    if not rows:
-        print(f"  No data found in {source_table}")
+        logger.warning(
+            f"  No common columns found between {source_table} and {dest_table}"
+        )
         return
 
     # Build UPSERT query that updates only common, non-PK columns
-    placeholders = ", ".join([f":{col}" for col in common_columns])
+    # (the WHERE true lets SQLite tell the ON CONFLICT clause from a join)
+    source = f"{SOURCE_SCHEMA}.{source_table}"
+    where = "true"
+    if dedup_by:
+        source = (
+            f"(SELECT *, ROW_NUMBER() OVER (PARTITION BY {dedup_by} ORDER BY rowid)"
+            f" AS dedup_rn FROM {source})"  # nosec B608
+        )
+        where = "dedup_rn = 1"
+    select_query = f"SELECT {columns_str} FROM {source} WHERE {where}"  # nosec B608
 
     if pk_columns:
         conflict_target = ", ".join(pk_columns)
@@ -85,36 +110,65 @@ def copy_table_data_sqlmodel(
         update_cols = [c for c in common_columns if c not in pk_columns]
         if update_cols:
             update_set = ", ".join([f"{c}=excluded.{c}" for c in update_cols])
+            # only rewrite the rows that actually changed (IS NOT is NULL-safe)
+            current = ", ".join(f"{dest_table}.{c}" for c in update_cols)
+            incoming = ", ".join(f"excluded.{c}" for c in update_cols)
             insert_query = (
-                f"INSERT INTO {dest_table} ({columns_str}) VALUES ({placeholders}) "  # nosec B608
-                f"ON CONFLICT({conflict_target}) DO UPDATE SET {update_set}"
+                f"INSERT INTO {dest_table} ({columns_str}) {select_query} "  # nosec B608
+                f"ON CONFLICT({conflict_target}) DO UPDATE SET {update_set} "
+                f"WHERE ({current}) IS NOT ({incoming})"
             )
         else:
             # Nothing to update besides PKs; do nothing on conflict
             insert_query = (
-                f"INSERT INTO {dest_table} ({columns_str}) VALUES ({placeholders}) "  # nosec B608
+                f"INSERT INTO {dest_table} ({columns_str}) {select_query} "  # nosec B608
                 f"ON CONFLICT({conflict_target}) DO NOTHING"
             )
     else:
         # Fallback: no PK info (unlikely). Use INSERT OR IGNORE to avoid clobbering.*
         # *We avoid REPLACE to prevent wiping destination-only fields.
-        insert_query = f"INSERT OR IGNORE INTO {dest_table} ({columns_str}) VALUES ({placeholders})"  # nosec B608
+        insert_query = (
+            f"INSERT OR IGNORE INTO {dest_table} ({columns_str}) {select_query}"  # nosec B608
+        )
 
-    # Execute upsert per row
-    for row in rows:
-        row_dict = {
-            col: row[i] if i < len(row) else None
-            for i, col in enumerate(common_columns)
-        }
-        dest_session.execute(text(insert_query), row_dict)
+    copied = dest_session.exec(text(insert_query)).rowcount
+
+    if not copied:
+        logger.info(f"  No new or changed rows in {source_table}")
+        return
 
     dest_session.commit()
-    print(f"  Copied {len(rows)} rows to {dest_table}")
+    logger.info(f"  Inserted or updated {copied} rows in {dest_table}")
+
+
+def attach_source(engine: Engine, source_db: Path):
+    """Attach the source DB to every destination connection, as SOURCE_SCHEMA"""
+
+    @event.listens_for(engine, "connect")
+    def _attach(dbapi_connection, _connection_record):
+        dbapi_connection.execute(
+            f"ATTACH DATABASE ? AS {SOURCE_SCHEMA}", (str(source_db),)
+        )
+
+
+def tune_for_bulk_load(engine: Engine):
+    """Trade durability for speed on the destination while copying: the
+    migration can just be run again if interrupted"""
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA synchronous=OFF")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA cache_size=-200000")  # ~200MB of page cache
+        cursor.execute("PRAGMA cache_spill=OFF")  # keep dirty pages until commit
+        cursor.execute("PRAGMA mmap_size=268435456")  # read up to 256MB via mmap
+        cursor.close()
 
 
 def populate_usernames_sqlmodel(dest_session: Session):
     """Populate username field for users who don't have one using the auth model function"""
-    print("\nPopulating usernames for users without them...")
+    logger.info("Populating usernames for users without them...")
 
     # Find users without usernames
     users_without_username = dest_session.exec(
@@ -122,48 +176,67 @@ def populate_usernames_sqlmodel(dest_session: Session):
     ).all()
 
     if not users_without_username:
-        print("  All users already have usernames")
+        logger.info("  All users already have usernames")
         return
 
-    print(f"  Found {len(users_without_username)} users without usernames")
+    logger.info(f"  Found {len(users_without_username)} users without usernames")
 
+    # Check the candidates against the taken usernames in memory, rather than
+    # with a query each
+    taken = set(
+        dest_session.exec(select(User.username).where(User.username.is_not(None)))
+    )
     updated_count = 0
     for user in users_without_username:
         # Use the populate_username function from models.auth
-        username = populate_username(dest_session, user)
+        populate_username(dest_session, user, taken)
         updated_count += 1
-        print(f"    Updated user {user.id} with username: {username}")
+        if updated_count % USERNAMES_PROGRESS_EVERY == 0:
+            logger.info(f"  ... {updated_count} usernames populated")
     dest_session.commit()
 
-    print(f"  Successfully populated usernames for {updated_count} users")
+    logger.info(f"  Successfully populated usernames for {updated_count} users")
 
 
 def deduplicate_plays_sqlmodel(dest_session: Session):
     """Remove duplicate records from plays table based on user_id, track_id and date"""
-    print("\nDeduplicating plays table...")
+    logger.info("Deduplicating plays table...")
 
     # Check if plays table exists by trying to query it
     try:
         count_query = text("SELECT COUNT(*) FROM plays")
         result = dest_session.exec(count_query)
         total_before = result.fetchone()[0]
-        print(f"  Total plays before deduplication: {total_before}")
+        logger.info(f"  Total plays before deduplication: {total_before}")
     except Exception:
-        print("  Plays table not found, skipping deduplication")
+        logger.info("  Plays table not found, skipping deduplication")
         return
 
     # Find duplicates based on user_id, track_id, and date (treating datetime variations as same)
-    # We'll keep the record with the minimum rowid (oldest record) for each group
-    dedup_query = text("""
+    # We'll keep the record with the minimum rowid (oldest record) for each group:
+    # ranking the rows in one pass, rather than testing each row against the
+    # list of the rowids to keep
+    dedup_query = text(f"""
         DELETE FROM plays
-        WHERE rowid NOT IN (
-            SELECT MIN(rowid)
-            FROM plays
-            GROUP BY user_id, track_id, DATE(date)
+        WHERE rowid IN (
+            SELECT rowid FROM (
+                SELECT rowid, ROW_NUMBER() OVER (
+                    PARTITION BY {PLAYS_DEDUP_KEY} ORDER BY rowid
+                ) AS rn
+                FROM plays
+            )
+            WHERE rn > 1
         )
-    """)
-
+    """)  # nosec B608
+
+    # A temporary index on the grouping expression (its entries end with the
+    # rowid) lets SQLite walk the partitions in order, instead of sorting the
+    # whole table in a temp B-tree
+    dest_session.exec(
+        text(f"CREATE INDEX IF NOT EXISTS tmp_plays_dedup ON plays ({PLAYS_DEDUP_KEY})")
+    )
     result = dest_session.exec(dedup_query)
+    dest_session.exec(text("DROP INDEX tmp_plays_dedup"))
     dest_session.commit()
 
     # Count records after deduplication
@@ -171,18 +244,51 @@ def deduplicate_plays_sqlmodel(dest_session: Session):
     total_after = count_after_result.fetchone()[0]
 
     deleted_count = total_before - total_after
-    print(f"  Deleted {deleted_count} duplicate records")
-    print(f"  Total plays after deduplication: {total_after}")
+    logger.info(f"  Deleted {deleted_count} duplicate records")
+    logger.info(f"  Total plays after deduplication: {total_after}")
+
+
+def drop_secondary_indexes(session: Session, tables: List[str]) -> List[tuple]:
+    """Drop the non-unique indexes of the given tables, returning their (name, sql)
+    to recreate them: building an index once is cheaper than maintaining it
+    row by row during the bulk copy. PK and UNIQUE constraints are kept, the
+    upserts rely on them."""
+    placeholders = ", ".join(f":t{i}" for i in range(len(tables)))
+    indexes = session.exec(
+        text(f"""
+            SELECT name, sql FROM sqlite_master
+            WHERE type='index' AND sql IS NOT NULL
+            AND sql NOT LIKE 'CREATE UNIQUE%'
+            AND tbl_name IN ({placeholders})
+        """),  # nosec B608
+        params={f"t{i}": table for i, table in enumerate(tables)},
+    ).all()
+    for name, _sql in indexes:
+        session.exec(text(f'DROP INDEX "{name}"'))
+    session.commit()
+    logger.info(f"Dropped {len(indexes)} indexes for the bulk copy")
+    return [tuple(index) for index in indexes]
 
 
-def get_tables_list(session: Session) -> List[str]:
+def restore_indexes(session: Session, indexes: List[tuple]):
+    """Recreate the indexes dropped by drop_secondary_indexes"""
+    session.rollback()  # whatever a failed copy left pending
+    for _name, sql in indexes:
+        session.exec(text(sql))
+    session.commit()
+    logger.info(f"Recreated {len(indexes)} indexes")
+
+
+def get_tables_list(session: Session, schema: str = "main") -> List[str]:
     """Get list of tables from database using SQLModel session"""
-    query = text("""
-        SELECT name FROM sqlite_master 
+    if schema not in ("main", SOURCE_SCHEMA):
+        raise ValueError(f"Unknown schema {schema}")
+    query = text(f"""
+        SELECT name FROM {schema}.sqlite_master 
         WHERE type='table' 
         AND name NOT LIKE 'sqlite_%' 
         AND name != 'alembic_version'
-    """)
+    """)  # nosec B608
     result = session.exec(query)
     return [row[0] for row in result.fetchall()]
 
@@ -193,32 +299,29 @@ def main():
     dest_db = script_dir / "lykd.sqlite"
 
     if not source_db.exists():
-        print(f"Error: Source database {source_db} not found!")
+        logger.error(f"Source database {source_db} not found!")
         sys.exit(1)
 
     if not dest_db.exists():
-        print(f"Error: Destination database {dest_db} not found!")
-        print("Make sure to run alembic migrations first to create the tables.")
+        logger.error(f"Destination database {dest_db} not found!")
+        logger.error("Make sure to run alembic migrations first to create the tables.")
         sys.exit(1)
 
-    print(f"Migrating data from {source_db} to {dest_db}")
+    logger.info(f"Migrating data from {source_db} to {dest_db}")
 
-    # Create SQLModel engines and sessions
-    source_engine = create_engine(f"sqlite:///{source_db}")
+    # Create the SQLModel engine and session, the source is attached to it
     dest_engine = create_engine(f"sqlite:///{dest_db}")
+    attach_source(dest_engine, source_db)
+    tune_for_bulk_load(dest_engine)
 
     try:
-        with (
-            Session(source_engine) as source_session,
-            Session(dest_engine) as dest_session,
-        ):
+        with Session(dest_engine) as dest_session:
             # Get list of tables from both databases
-            source_tables = get_tables_list(source_session)
+            source_tables = get_tables_list(dest_session, SOURCE_SCHEMA)
             dest_tables = get_tables_list(dest_session)
 
-            print(f"Source tables: {source_tables}")
-            print(f"Destination tables: {dest_tables}")
-            print()
+            logger.info(f"Source tables: {source_tables}")
+            logger.info(f"Destination tables: {dest_tables}")
 
             # Define table mappings (source -> destination)
             table_mappings = {
@@ -232,39 +335,60 @@ def main():
                 "liked": "likes",
             }
 
-            # Copy data for each table mapping
-            for source_table, dest_table in table_mappings.items():
-                if source_table in source_tables and dest_table in dest_tables:
-                    copy_table_data_sqlmodel(
-                        source_session, dest_session, source_table, dest_table
-                    )
-                elif source_table in source_tables:
-                    print(
-                        f"Warning: Source table '{source_table}' exists but destination table '{dest_table}' not found"
-                    )
-
-            # Populate usernames for users without them
-            populate_usernames_sqlmodel(dest_session)
-
-            # Deduplicate plays after migration
-            deduplicate_plays_sqlmodel(dest_session)
-
-            print("\nData migration completed successfully!")
+            copied_tables = [
+                dest_table
+                for source_table, dest_table in table_mappings.items()
+                if source_table in source_tables and dest_table in dest_tables
+            ]
+            # the plays are deduplicated while copying them: a separate pass is
+            # needed only to dedup against the plays that were already there
+            had_plays = (
+                "plays" in dest_tables
+                and dest_session.exec(
+                    text("SELECT EXISTS (SELECT 1 FROM plays)")
+                ).one()[0]
+            )
+            dropped_indexes = drop_secondary_indexes(dest_session, copied_tables)
+            try:
+                # Copy data for each table mapping
+                for source_table, dest_table in table_mappings.items():
+                    if source_table in source_tables and dest_table in dest_tables:
+                        copy_table_data_sqlmodel(
+                            dest_session,
+                            source_table,
+                            dest_table,
+                            dedup_by=PLAYS_DEDUP_KEY if dest_table == "plays" else None,
+                        )
+                    elif source_table in source_tables:
+                        logger.warning(
+                            f"Source table '{source_table}' exists but destination table '{dest_table}' not found"
+                        )
+
+                # Populate usernames for users without them
+                populate_usernames_sqlmodel(dest_session)
+
+                # Deduplicate plays after migration
+                if had_plays:
+                    deduplicate_plays_sqlmodel(dest_session)
+            finally:
+                restore_indexes(dest_session, dropped_indexes)
+
+            logger.info("Data migration completed successfully!")
 
             # Show summary
-            print("\nSummary:")
+            logger.info("Summary:")
             for dest_table in dest_tables:
                 if dest_table != "alembic_version":
                     count_query = text(f"SELECT COUNT(*) FROM {dest_table}")  # nosec B608
                     result = dest_session.exec(count_query)
                     count = result.fetchone()[0]
-                    print(f"  {dest_table}: {count} rows")
+                    logger.info(f"  {dest_table}: {count} rows")
 
     except Exception as e:
-        print(f"Error during migration: {e}")
-        print(e.with_traceback())
+        logger.exception(f"Error during migration: {e}")
         sys.exit(1)
 
 
 if __name__ == "__main__":  # pragma no cover
+    setup_logs()
     main()
@@ -1,6 +1,6 @@
 # this file manages a cache enriching tracks
 from functools import partial
-from typing import Sequence, Any
+from typing import Any
 
 from expiringdict import ExpiringDict
 from sqlmodel import Session, select
@@ -13,6 +13,7 @@ new_cache = partial(
     max_age_seconds=10 * 60,  # 10 minutes cache
     items={},
 )
+NO_LIKES: frozenset[str] = frozenset()
 
 
 class CacheService:
@@ -20,6 +21,10 @@ class CacheService:
         self.track_cache = new_cache()
         self.user_cache = new_cache()
         self.likes_cache = new_cache()
+        # aggregate counts for /spotify/stats, polled by the dashboard
+        self.stats_cache = new_cache(max_age_seconds=60)
+        # Spotify track details for the player, they practically never change
+        self.spotify_track_cache = new_cache(max_age_seconds=60 * 60)
 
     def get_users(self, user_ids, db: Session):
         missing_ids = [uid for uid in user_ids if uid not in self.user_cache]
@@ -34,16 +39,69 @@ class CacheService:
                 }
         return {uid: self.user_cache[uid] for uid in user_ids}
 
-    def get_likes(self, user: User, db: Session) -> set[str]:
+    def get_likes(self, user: User, db: Session) -> frozenset[str]:
         if not user:
-            return set()
+            return NO_LIKES
         if user.id not in self.likes_cache:
-            likes = set(
+            likes = frozenset(
                 db.exec(select(Like.track_id).where(Like.user_id == user.id)).all()
             )
             self.likes_cache[user.id] = likes
         return self.likes_cache[user.id]
 
+    def get_tracks(self, track_ids: set[str], db: Session) -> dict[str, dict]:
+        """The track payloads (with album and artist names) of the known tracks"""
+        tracks: dict[str, dict] = {}
+        missing_ids = set()
+        for track_id in track_ids:
+            track = self.track_cache.get(track_id)
+            if track is None:
+                missing_ids.add(track_id)
+            else:
+                tracks[track_id] = track
+        if not missing_ids:
+            return tracks
+
+        # Artists per track (the artists we don't know are left out)
+        track_artists: dict[str, list[str]] = {}
+        for track_id, artist_name in db.exec(
+            select(TrackArtist.track_id, Artist.name)
+            .join(Artist, TrackArtist.artist_id == Artist.id)
+            .where(TrackArtist.track_id.in_(missing_ids))
+        ).all():
+            if artist_name:
+                track_artists.setdefault(track_id, []).append(artist_name)
+
+        # Tracks with their album, in one go
+        for track, album in db.exec(
+            select(Track, Album)
+            .join(Album, Track.album_id == Album.id, isouter=True)
+            .where(Track.id.in_(missing_ids))
+        ).all():
+            # plain dicts: they outlive the session
+            tracks[track.id] = self.track_cache[track.id] = {
+                "id": track.id,
+                "title": track.title,
+                "duration": track.duration,
+                "album": (
+                    {
+                        "id": album.id,
+                        "name": album.name,
+                        "picture": album.picture,
+                        "release_date": album.release_date.isoformat()
+                        if album.release_date
+                        else None,
+                    }
+                    if album
+                    else None
+                ),
+                "artists": track_artists.get(track.id, []),
+            }
+        return tracks
+
+    def invalidate_stats(self, user_id: str) -> None:
+        self.stats_cache.pop(user_id, None)
+
     def enrich_tracks(
         self,
         items: list[Play | Like],
@@ -54,44 +112,13 @@ class CacheService:
         track_ids = {t.track_id for t in items}
         user_ids = [user.id] if user else []
         users_map = self.get_users(user_ids + [track.user_id for track in items], db)
-        user_likes = self.get_likes(user, db) if user else set()
-        tracks: Sequence[Track] = db.exec(
-            select(Track).where(Track.id.in_(track_ids))
-        ).all()
-        tracks_map: dict[str, Track] = {t.id: t for t in tracks}
-
-        # Album info
-        album_ids = {t.album_id for t in tracks if t.album_id}
-        albums_map: dict[str, Album] = {
-            a.id: a for a in db.exec(select(Album).where(Album.id.in_(album_ids))).all()
-        }
-
-        # Artists per track
-        ta_rows = db.exec(
-            select(TrackArtist).where(TrackArtist.track_id.in_(track_ids))
-        ).all()
-        artist_ids = list({ta.artist_id for ta in ta_rows})
-        artists_map: dict[str, Artist] = {
-            a.id: a
-            for a in db.exec(select(Artist).where(Artist.id.in_(artist_ids))).all()
-        }
-        track_artists: dict[str, list[str]] = {}
-        for ta in ta_rows:
-            track_artists.setdefault(ta.track_id, []).append(
-                artists_map.get(ta.artist_id).name
-                if artists_map.get(ta.artist_id)
-                else None
-            )
-        # Clean None
-        for k, v in list(track_artists.items()):
-            track_artists[k] = [x for x in v if x]
+        user_likes = self.get_likes(user, db)
+        tracks_map = self.get_tracks(track_ids, db)
 
         # Build items
         results: list[dict[str, Any]] = []
         for p in items:
             u = users_map.get(p.user_id, {})
-            t = tracks_map.get(p.track_id)
-            album = albums_map.get(t.album_id) if (t and t.album_id) else None
             results.append(
                 {
                     "user": {
@@ -100,23 +127,13 @@ class CacheService:
                         "username": u.get("username"),
                         "picture": u.get("picture"),
                     },
-                    "track": {
-                        "id": t.id if t else p.track_id,
-                        "title": t.title if t else None,
-                        "duration": t.duration if t else None,
-                        "album": (
-                            {
-                                "id": album.id,
-                                "name": album.name,
-                                "picture": album.picture,
-                                "release_date": album.release_date.isoformat()
-                                if album and album.release_date
-                                else None,
-                            }
-                            if album
-                            else None
-                        ),
-                        "artists": track_artists.get(p.track_id, []),
+                    "track": tracks_map.get(p.track_id)
+                    or {
+                        "id": p.track_id,
+                        "title": None,
+                        "duration": None,
+                        "album": None,
+                        "artists": [],
                     },
                     date_field: getattr(p, date_field).isoformat(),
                     "context_uri": getattr(p, "context_uri", None),
@@ -1,5 +1,9 @@
+import functools
 import logging
 import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.image import MIMEImage
@@ -10,10 +14,68 @@ from models.auth import User
 
 logger = logging.getLogger("lykd.email")
 
-
+# SMTP is slow (connect, TLS, login): the emails are sent in the background,
+# the callers are request handlers. One worker, on a single SMTP connection
+email_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="email")
+SMTP_MAX_IDLE_SECONDS = 60  # servers drop idle clients, don't reuse stale ones
+
+
+class SMTPConnection:
+    """A logged-in SMTP connection, kept open between emails"""
+
+    def __init__(self):
+        self.server: smtplib.SMTP | None = None
+        self.last_used = 0.0
+        self.lock = threading.Lock()
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT, timeout=20)
+        if settings.SMTP_USE_TLS:
+            server.starttls()
+        server.login(settings.SMTP_USERNAME, settings.SMTP_PASSWORD)
+        return server
+
+    def close(self):
+        if self.server:
+            try:
+                self.server.quit()
+            except smtplib.SMTPException:  # pragma: no cover
+                pass
+            self.server = None
+
+    def send(self, message) -> None:
+        with self.lock:
+            if (
+                self.server
+                and time.monotonic() - self.last_used > SMTP_MAX_IDLE_SECONDS
+            ):
+                self.close()
+            reused = self.server is not None
+            if not reused:
+                self.server = self._connect()
+            try:
+                self.server.send_message(message)
+            except smtplib.SMTPServerDisconnected:
+                self.server = None
+                if not reused:
+                    raise
+                # the server closed the connection we kept: retry on a new one
+                self.server = self._connect()
+                self.server.send_message(message)
+            except smtplib.SMTPException:
+                self.close()
+                raise
+            self.last_used = time.monotonic()
+
+
+smtp_connection = SMTPConnection()
+
+
+@functools.cache
 def _load_logo_assets() -> dict:
     """Load logo assets (PNG only for broad email client support).
 
+    Read once: the logo doesn't change while the app runs.
     Returns dict with key: png_bytes | None
     """
     project = settings.PROJECT_PATH
@@ -30,6 +92,18 @@ def _load_logo_assets() -> dict:
     return {"png_bytes": png_bytes}
 
 
+@functools.cache
+def _logo_mime() -> MIMEImage | None:
+    """The inline logo part, base64-encoded once and attached to every email"""
+    png_bytes = _load_logo_assets().get("png_bytes")
+    if not png_bytes:
+        return None
+    img = MIMEImage(png_bytes, _subtype="png")
+    img.add_header("Content-ID", "<logo_png>")
+    img.add_header("Content-Disposition", "inline", filename="logo.png")
+    return img
+
+
 def _smtp_configured() -> bool:
     return bool(
         settings.SMTP_HOST and settings.SMTP_USERNAME and settings.SMTP_PASSWORD
@@ -37,6 +111,7 @@ def _smtp_configured() -> bool:
 
 
 def _send_email(subject: str, html: str, text: str, to_email: str) -> bool:
+    """Queue the email for sending, returns whether it was queued"""
     if settings.TESTING_MODE or not _smtp_configured():
         # Skip sending in tests or when SMTP is not configured
         logger.info(
@@ -44,6 +119,11 @@ def _send_email(subject: str, html: str, text: str, to_email: str) -> bool:
         )
         return False
 
+    email_pool.submit(_deliver_email, subject, html, text, to_email)
+    return True
+
+
+def _deliver_email(subject: str, html: str, text: str, to_email: str) -> bool:
     from_name = settings.SMTP_FROM_NAME
     from_email = settings.SMTP_FROM_EMAIL
 
@@ -59,19 +139,12 @@ def _send_email(subject: str, html: str, text: str, to_email: str) -> bool:
     msg_alt.attach(MIMEText(html, "html", "utf-8"))
 
     # Attach PNG image (inline)
-    assets = _load_logo_assets()
-    if assets.get("png_bytes"):
-        img = MIMEImage(assets["png_bytes"], _subtype="png")
-        img.add_header("Content-ID", "<logo_png>")
-        img.add_header("Content-Disposition", "inline", filename="logo.png")
-        msg_root.attach(img)
+    logo = _logo_mime()
+    if logo:
+        msg_root.attach(logo)
 
     try:
-        with smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT, timeout=20) as server:
-            if settings.SMTP_USE_TLS:
-                server.starttls()
-            server.login(settings.SMTP_USERNAME, settings.SMTP_PASSWORD)
-            server.send_message(msg_root)
+        smtp_connection.send(msg_root)
         logger.info(f"Email sent to {to_email}: {subject}")
         return True
     except Exception as e:  # pragma: no cover
@@ -79,43 +152,34 @@ def _send_email(subject: str, html: str, text: str, to_email: str) -> bool:
         return False
 
 
-def _base_styles() -> str:
-    return (
-        "body{margin:0;padding:0;background:#0d0f14;color:#e9edf1;font-family:system-ui,-apple-system,Segoe UI,Roboto,Ubuntu,Cantarell,Noto Sans,sans-serif}"
-        ".wrapper{max-width:560px;margin:0 auto;padding:24px}"
-        ".card{background:#131722;border:1px solid #1d2333;border-radius:12px;overflow:hidden}"
-        ".header{display:flex;align-items:center;gap:12px;padding:20px 20px 0}"
-        ".logo{height:28px;vertical-align:middle}"
-        ".brand{font-size:18px;font-weight:700;letter-spacing:0.4px;color:#e9edf1}"
-        ".content{padding:16px 20px 24px;font-size:15px;line-height:1.6}"
-        ".cta{display:inline-block;background:#3b82f6;color:#fff;text-decoration:none;padding:10px 16px;border-radius:8px;font-weight:600}"
-        ".muted{color:#a7b0c0;font-size:12px;margin-top:16px}"
-        "a{color:#93c5fd}"
-    )
-
-
-def _render_shell(inner_html: str) -> str:
-    # Prefer embedded PNG; otherwise fall back to external PNG URL
-    has_png = bool(_load_logo_assets().get("png_bytes"))
-    logo_img = (
-        '<img src="cid:logo_png" alt="LYKD" class="logo" />'
-        if has_png
-        else f'<img src="{settings.BASE_URL}/logo.png" alt="LYKD" class="logo" />'
-    )
-    return f"""
+BASE_STYLES = (
+    "body{margin:0;padding:0;background:#0d0f14;color:#e9edf1;font-family:system-ui,-apple-system,Segoe UI,Roboto,Ubuntu,Cantarell,Noto Sans,sans-serif}"
+    ".wrapper{max-width:560px;margin:0 auto;padding:24px}"
+    ".card{background:#131722;border:1px solid #1d2333;border-radius:12px;overflow:hidden}"
+    ".header{display:flex;align-items:center;gap:12px;padding:20px 20px 0}"
+    ".logo{height:28px;vertical-align:middle}"
+    ".brand{font-size:18px;font-weight:700;letter-spacing:0.4px;color:#e9edf1}"
+    ".content{padding:16px 20px 24px;font-size:15px;line-height:1.6}"
+    ".cta{display:inline-block;background:#3b82f6;color:#fff;text-decoration:none;padding:10px 16px;border-radius:8px;font-weight:600}"
+    ".muted{color:#a7b0c0;font-size:12px;margin-top:16px}"
+    "a{color:#93c5fd}"
+)
+
+# the email page, to fill with str.format()
+SHELL_TEMPLATE = """
 <!doctype html>
 <html>
   <head>
     <meta name=\"viewport\" content=\"width=device-width,initial-scale=1\" />
     <meta http-equiv=\"Content-Type\" content=\"text/html; charset=UTF-8\" />
     <title>LYKD</title>
-    <style>{_base_styles()}</style>
+    <style>{styles}</style>
   </head>
   <body>
     <div class=\"wrapper\">
       <div class=\"card\">
-        <div class=\"header\">{logo_img}<div class=\"brand\">LYKD</div></div>
-        <div class=\"content\">{inner_html}</div>
+        <div class=\"header\">{logo}<div class=\"brand\">LYKD</div></div>
+        <div class=\"content\">{content}</div>
       </div>
     </div>
   </body>
@@ -123,6 +187,20 @@ def _render_shell(inner_html: str) -> str:
 """
 
 
+@functools.cache
+def _logo_img() -> str:
+    # Prefer embedded PNG; otherwise fall back to external PNG URL
+    if _load_logo_assets().get("png_bytes"):
+        return '<img src="cid:logo_png" alt="LYKD" class="logo" />'
+    return f'<img src="{settings.BASE_URL}/logo.png" alt="LYKD" class="logo" />'
+
+
+def _render_shell(inner_html: str) -> str:
+    return SHELL_TEMPLATE.format(
+        styles=BASE_STYLES, logo=_logo_img(), content=inner_html
+    )
+
+
 def _safe_name(user: User) -> str:
     return (user.name or user.username or user.email or "A friend").strip()
 
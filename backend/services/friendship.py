@@ -1,7 +1,8 @@
 import datetime
 import logging
 
-from sqlmodel import Session, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Session, delete, update
 
 from models.auth import User
 from models.friendship import Friendship, FriendshipStatus
@@ -17,49 +18,43 @@ def request_friendship(
         raise ValueError("Cannot friend yourself.")
 
     low, high = Friendship.canonical_pair(requester.id, recipient.id)
-    existing = session.exec(
-        select(Friendship).where(
-            Friendship.user_low_id == low,
-            Friendship.user_high_id == high,
-        )
-    ).first()
-
     now = datetime.datetime.now(datetime.timezone.utc)
-    if existing:
-        match existing.status:
-            case FriendshipStatus.accepted:
-                raise ValueError("Users are already friends.")
-            case FriendshipStatus.pending:
-                # Optional: if the opposite user sends another request, you could auto-accept here.
-                raise ValueError("A request is already pending.")
-            case _:
-                # Re-open the flow
-                logger.debug("Refreshing the friendship request.")
-                existing.status = FriendshipStatus.pending
-                existing.requested_by_id = requester.id
-                existing.requested_at = now
-                existing.responded_at = None
-                session.add(existing)
-                session.commit()
-                # Notify recipient of (re)opened request
-                try:
-                    email_service.send_friend_request_email(
-                        requester=requester, recipient=recipient
-                    )
-                except Exception as e:  # pragma: no cover
-                    logger.error(f"Failed to send friend request email: {e}")
-                return existing
-
-    friendship = Friendship(
-        user_low_id=low,
-        user_high_id=high,
-        status=FriendshipStatus.pending,
-        requested_by_id=requester.id,
-        requested_at=now,
+    # Create the request, or re-open a declined one, in a single statement
+    stmt = (
+        insert(Friendship)
+        .values(
+            user_low_id=low,
+            user_high_id=high,
+            status=FriendshipStatus.pending,
+            requested_by_id=requester.id,
+            requested_at=now,
+        )
+        .on_conflict_do_update(
+            index_elements=[Friendship.user_low_id, Friendship.user_high_id],
+            set_=dict(
+                status=FriendshipStatus.pending,
+                requested_by_id=requester.id,
+                requested_at=now,
+                responded_at=None,
+            ),
+            where=Friendship.status.not_in(
+                [FriendshipStatus.pending, FriendshipStatus.accepted]
+            ),
+        )
+        .returning(Friendship)
     )
-    session.add(friendship)
+    friendship = session.scalars(stmt).first()
+    if not friendship:
+        session.rollback()
+        # The pair exists and the request can't be (re)opened: tell why
+        existing = session.get(Friendship, (low, high))
+        if existing and existing.status == FriendshipStatus.accepted:
+            raise ValueError("Users are already friends.")
+        # Optional: if the opposite user sends another request, you could auto-accept here.
+        raise ValueError("A request is already pending.")
     session.commit()
-    # Notify recipient of new request
+
+    # Notify recipient of the new (or re-opened) request
     try:
         email_service.send_friend_request_email(
             requester=requester, recipient=recipient
@@ -69,37 +64,55 @@ def request_friendship(
     return friendship
 
 
-def accept_friendship(
-    session: Session, *, requester: User, recipient: User
-) -> Friendship:
-    low, high = Friendship.canonical_pair(requester.id, recipient.id)
-    friendship = session.exec(
-        select(Friendship).where(
+def _respond(
+    session: Session, low: str, high: str, status: FriendshipStatus, *conditions
+) -> Friendship | None:
+    """Move a pending request to the given status, in a single statement.
+    Returns the updated friendship, or None when there's no matching pending request.
+    """
+    stmt = (
+        update(Friendship)
+        .where(
             Friendship.user_low_id == low,
             Friendship.user_high_id == high,
+            Friendship.status == FriendshipStatus.pending,
+            *conditions,
+        )
+        .values(
+            status=status,
+            responded_at=datetime.datetime.now(datetime.timezone.utc),
         )
-    ).first()
-    if not friendship or friendship.status != FriendshipStatus.pending:
-        raise ValueError("No pending request to accept.")
+        .returning(Friendship)
+    )
+    return session.scalars(stmt).first()
 
-    # The original requester cannot accept their own request.
-    if friendship.requested_by_id == requester.id:
-        raise PermissionError("Requester cannot accept their own request.")
 
-    friendship.status = FriendshipStatus.accepted
-    friendship.responded_at = datetime.datetime.now(datetime.timezone.utc)
-    session.add(friendship)
+def accept_friendship(
+    session: Session, *, requester: User, recipient: User
+) -> Friendship:
+    low, high = Friendship.canonical_pair(requester.id, recipient.id)
+    friendship = _respond(
+        session,
+        low,
+        high,
+        FriendshipStatus.accepted,
+        # The original requester cannot accept their own request.
+        Friendship.requested_by_id != requester.id,
+    )
+    if not friendship:
+        session.rollback()
+        pending = session.get(Friendship, (low, high))
+        if not pending or pending.status != FriendshipStatus.pending:
+            raise ValueError("No pending request to accept.")
+        raise PermissionError("Requester cannot accept their own request.")
     session.commit()
 
-    # Notify the original requester that their request was accepted
+    # Notify the original requester that their request was accepted: it can
+    # only be the other user, there's no need to look them up
     try:
-        original_requester = session.exec(
-            select(User).where(User.id == friendship.requested_by_id)
-        ).first()
-        if original_requester:
-            email_service.send_friend_accepted_email(
-                acceptor=requester, original_requester=original_requester
-            )
+        email_service.send_friend_accepted_email(
+            acceptor=requester, original_requester=recipient
+        )
     except Exception as e:  # pragma: no cover
         logger.error(f"Failed to send friend accepted email: {e}")
 
@@ -110,31 +123,24 @@ def decline_friendship(
     session: Session, *, requester: User, recipient: User
 ) -> Friendship:
     low, high = Friendship.canonical_pair(requester.id, recipient.id)
-    friendship = session.exec(
-        select(Friendship).where(
-            Friendship.user_low_id == low,
-            Friendship.user_high_id == high,
-        )
-    ).first()
-    if not friendship or friendship.status != FriendshipStatus.pending:
+    friendship = _respond(session, low, high, FriendshipStatus.declined)
+    if not friendship:
+        session.rollback()
         raise ValueError("No pending request to decline.")
-    friendship.status = FriendshipStatus.declined
-    friendship.responded_at = datetime.datetime.now(datetime.timezone.utc)
-    session.add(friendship)
     session.commit()
     return friendship
 
 
 def unfriend(session: Session, *, user_id: str, other_id: str) -> None:
     low, high = Friendship.canonical_pair(user_id, other_id)
-    friendship = session.exec(
-        select(Friendship).where(
+    deleted = session.exec(
+        delete(Friendship).where(
             Friendship.user_low_id == low,
             Friendship.user_high_id == high,
             Friendship.status == FriendshipStatus.accepted,
         )
-    ).first()
-    if not friendship:
+    ).rowcount
+    if not deleted:
+        session.rollback()
         raise ValueError("No existing friendship to decline.")
-    session.delete(friendship)
     session.commit()
@@ -5,7 +5,8 @@ from models.auth import User
 from models.music import Like, PlaylistTrack, Play, Playlist
 from services import Spotify
 from services.store import (
-    store_track,
+    insert_plays,
+    store_tracks,
     store_playlist,
     update_likes_db,
     update_playlist_db,
@@ -14,9 +15,11 @@ from sqlmodel import select, Session
 
 import logging
 
+from utils.chunks import abatched
 from utils.dates import parse_date
 
 logger = logging.getLogger("lykd.likes")
+PLAYS_BATCH_SIZE = 50  # a page of recently played
 
 
 async def get_one_liked_playlist(
@@ -87,33 +90,27 @@ async def process_likes(db: Session, spotify: Spotify, user: User) -> None:
         or user.last_like_scan_full <= now - datetime.timedelta(hours=12)
     )
 
-    all_db_like_ids = {
-        like.track_id
-        for like in db.exec(
-            select(Like).where(
-                Like.user_id == user.id,
-            )
-        )
-    }
+    all_db_like_ids = set(db.exec(select(Like.track_id).where(Like.user_id == user.id)))
 
     if full_scan:
         logger.info(f"Full scan for {user} likes")
         # Fetch all liked songs from Spotify
-        # TODO: Deduplicate likes before full-sync here
         all_spotify_likes = await spotify.get_all_likes(
             user=user,
             db_session=db,
         )
         logger.info(f"Processing {len(all_spotify_likes)} liked songs for user {user}:")
 
-        all_spotify_likes_ids = {
-            spotify_like["track"]["id"] for spotify_like in all_spotify_likes
-        }
-        new_spotify_likes = [
-            spotify_like
-            for spotify_like in all_spotify_likes
-            if spotify_like["track"]["id"] not in all_db_like_ids
-        ]
+        # One pass: collect the liked ids and the new likes, once per track
+        all_spotify_likes_ids = set()
+        new_spotify_likes = []
+        for spotify_like in all_spotify_likes:
+            track_id = spotify_like["track"]["id"]
+            if track_id in all_spotify_likes_ids:
+                continue  # a duplicate: keep the first (the latest) like
+            all_spotify_likes_ids.add(track_id)
+            if track_id not in all_db_like_ids:
+                new_spotify_likes.append(spotify_like)
 
         tracks_to_remove = all_db_like_ids - all_spotify_likes_ids
     else:
@@ -129,8 +126,7 @@ async def process_likes(db: Session, spotify: Spotify, user: User) -> None:
             request=spotify.get_liked_page,
         ):
             track_id = spotify_like.get("track", {}).get("id")
-            existing_like = db.get(Like, (user.id, track_id))
-            if existing_like:
+            if track_id in all_db_like_ids:  # we are up to date from here on
                 break
 
             new_spotify_likes.append(spotify_like)
@@ -169,25 +165,22 @@ async def process_likes(db: Session, spotify: Spotify, user: User) -> None:
                 )
                 tracks_to_remove = existing_tracks_ids  # remove all
 
-                new_spotify_likes = []  # get all the likes again - avoiding duplicates from the oldest
-                distinct_tracks = set()
-                for spot_like in existing_spotify_tracks[::-1]:
-                    track_id = spot_like["track"]["id"]
-                    if track_id not in distinct_tracks:
-                        distinct_tracks.add(track_id)
-                        new_spotify_likes.append(spot_like)
-                new_spotify_likes = new_spotify_likes[::-1]
+                # get all the likes again - avoiding duplicates from the oldest:
+                # the last occurrence of each track, in the playlist order
+                distinct_tracks = {}
+                for spot_like in reversed(existing_spotify_tracks):
+                    distinct_tracks.setdefault(spot_like["track"]["id"], spot_like)
+                new_spotify_likes = list(reversed(distinct_tracks.values()))
                 existing_tracks_ids = set()  # we are going to delete them all
 
         else:
-            existing_tracks_ids = {
-                pt.track_id
-                for pt in db.exec(
-                    select(PlaylistTrack).where(
+            existing_tracks_ids = set(
+                db.exec(
+                    select(PlaylistTrack.track_id).where(
                         PlaylistTrack.playlist_id == playlist.id,
                     )
                 )
-            }
+            )
     else:
         # we assume that the playlist contains what we knew from the DB
         existing_tracks_ids = all_db_like_ids
@@ -199,43 +192,38 @@ async def process_likes(db: Session, spotify: Spotify, user: User) -> None:
     # - all_db_like_ids: the set of tracks in the DB
 
     if new_spotify_likes or tracks_to_remove or existing_tracks_ids != all_db_like_ids:
-        tracks_to_add = {
-            spotify_like.get("track", {}).get("id")
-            for spotify_like in new_spotify_likes
-        }
+        # everything we need from the new likes, in one pass
+        new_tracks = []
+        tracks_to_add = set()
+        playlist_additions = []  # we need the order of the tracks to be preserved
+        new_likes = []
+        new_playlist_tracks = []
+        for spotify_like in new_spotify_likes:
+            track = spotify_like.get("track", {})
+            track_id = track.get("id")
+            date = parse_date(spotify_like["added_at"])
+            new_tracks.append(track)
+            tracks_to_add.add(track_id)
+            if track_id not in existing_tracks_ids:
+                playlist_additions.append(track_id)
+            new_likes.append(Like(user_id=user.id, track_id=track_id, date=date))
+            new_playlist_tracks.append(
+                PlaylistTrack(playlist_id=playlist.id, track_id=track_id, date=date)
+            )
+
         logger.debug(
             f"Likes for {user}: {len(tracks_to_add)} to add, {len(tracks_to_remove)} to remove"
         )
 
-        for spot_like in new_spotify_likes:
-            track_data = spot_like.get("track", {})
-            try:
-                store_track(track_data, db)
-            except Exception as e:
-                logger.error(
-                    f" Error processing track {track_data.get('name', 'Unknown')}: {e}"
-                )
+        store_tracks(new_tracks, db)
 
         new_change_snapshot = await spotify.change_playlist(
             user=user,
             db_session=db,
             playlist_id=playlist.id,
-            tracks_to_add=[  # we need the order of the tracks to be preserved
-                track_id
-                for spotify_like in new_spotify_likes
-                if (track_id := spotify_like.get("track", {}).get("id"))
-                not in existing_tracks_ids
-            ],
+            tracks_to_add=playlist_additions,
             tracks_to_remove=tracks_to_remove,
         )
-        new_likes = [
-            Like(
-                user_id=user.id,
-                track_id=like.get("track", {}).get("id"),
-                date=parse_date(like["added_at"]),
-            )
-            for like in new_spotify_likes
-        ]
         update_likes_db(
             user,
             likes_to_add=new_likes,
@@ -244,31 +232,23 @@ async def process_likes(db: Session, spotify: Spotify, user: User) -> None:
         )
         update_playlist_db(
             playlist.id,
-            tracks_to_add=[
-                PlaylistTrack(
-                    playlist_id=playlist.id,
-                    track_id=like.track_id,
-                    date=like.date,
-                )
-                for like in new_likes
-            ],
+            tracks_to_add=new_playlist_tracks,
             tracks_to_remove=tracks_to_remove,
             snapshot_id=new_change_snapshot if full_scan else None,
             db=db,
         )
-        db.commit()
         logger.info(
             f"{user} likes:"
             f" {len(tracks_to_add)} added, {len(tracks_to_remove)} deleted "
         )
-    # update the user with the new last scan time
-    now = datetime.datetime.now(datetime.timezone.utc)
+    # update the user with the new last scan time (from when the scan started:
+    # the changes after that will be picked up by the next one)
     if full_scan:
         user.last_like_scan_full = now
     else:
         user.last_like_scan = now
     db.add(user)
-    db.commit()
+    db.commit()  # the likes changes and the scan time, together
 
 
 async def process_user(db: Session, user: User, spotify: Spotify):
@@ -279,34 +259,56 @@ async def process_user(db: Session, user: User, spotify: Spotify):
     await process_plays(db, spotify, user)
 
 
+def as_utc(date: datetime.datetime) -> datetime.datetime:
+    """Spotify times are UTC: make them comparable with the stored ones"""
+    return date if date.tzinfo else date.replace(tzinfo=datetime.timezone.utc)
+
+
 async def process_plays(db: Session, spotify: Spotify, user):
     # this works a bit differently than likes
     # we yield and stop as soon as we find a play that has been already written
-    added = 0
-    async for play in spotify.yield_from(
-        user=user,
-        db_session=db,
-        request=spotify.get_recently_played_page,
+    # the plays are checked against the DB a page at a time
+    new_tracks = []
+    new_plays = []
+    up_to_date = False
+    async for plays in abatched(
+        spotify.yield_from(
+            user=user,
+            db_session=db,
+            request=spotify.get_recently_played_page,
+        ),
+        PLAYS_BATCH_SIZE,
     ):
-        track_data = play.get("track", {})
-        track_id = track_data.get("id")
-        played_at = parse_date(play.get("played_at"))
-        existing_play = db.get(Play, (user.id, track_id, played_at))
-        if existing_play:
-            # play already exists, stop processing
-            break
-        context = play.get("context") or {}
-        context_uri = context.get("uri")
-        track = store_track(track_data, db)
-        db.merge(
-            Play(
-                user_id=user.id,
-                track_id=track.id,
-                date=played_at,
-                context_uri=context_uri,
+        played_at = [as_utc(parse_date(play.get("played_at"))) for play in plays]
+        existing_plays = {
+            (track_id, as_utc(date))
+            for track_id, date in db.exec(
+                select(Play.track_id, Play.date).where(
+                    Play.user_id == user.id, Play.date.in_(played_at)
+                )
             )
-        )
-        added += 1
-    if added > 0:
-        logger.info(f"Added {added} new plays from {user}")
+        }
+        for play, date in zip(plays, played_at):
+            track_data = play.get("track", {})
+            track_id = track_data.get("id")
+            if (track_id, date) in existing_plays:
+                # play already exists, stop processing
+                up_to_date = True
+                break
+            context = play.get("context") or {}
+            new_tracks.append(track_data)
+            new_plays.append(
+                dict(
+                    user_id=user.id,
+                    track_id=track_id,
+                    date=date,
+                    context_uri=context.get("uri"),
+                )
+            )
+        if up_to_date:
+            break
+    if new_plays:
+        store_tracks(new_tracks, db)
+        insert_plays(new_plays, db)
+        logger.info(f"Added {len(new_plays)} new plays from {user}")
         db.commit()
@@ -1,5 +1,6 @@
 """Spotify API integration"""
 
+import asyncio
 import datetime
 import logging
 import os
@@ -20,12 +21,61 @@ from utils.chunks import reverse_block_chunks
 from fastapi import Request
 
 logger = logging.getLogger("lykd.spotify")
+PAGE_CONCURRENCY = 5  # pages of the same listing requested at once
+
+
+def new_http_client(
+    max_connections: int = 10, max_keepalive_connections: int = 10
+) -> httpx.AsyncClient:
+    # keep alive as many connections as we may open: paginated calls come in
+    # bursts, and a closed connection means a new TCP+TLS handshake.
+    # Slow responses are fine, an unreachable host should fail fast
+    return httpx.AsyncClient(
+        verify=settings.HTTPS_VERIFY,
+        timeout=httpx.Timeout(30.0, connect=5.0),
+        limits=httpx.Limits(
+            max_keepalive_connections=max_keepalive_connections,
+            max_connections=max_connections,
+        ),
+    )
+
+
+class RequestThrottle:
+    """Space the requests to at most `rate` per second (0 disables it).
+
+    Spotify rate-limits each app, not each user: one throttle is shared by
+    every client of the same app in the process (see Spotify.__init__).
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next_slot = 0.0
+
+    async def wait(self):
+        """Wait for the next free slot"""
+        if not self.interval:
+            return
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def pause(self, seconds: float):
+        """Hold every request for a while, e.g. when Spotify asks to retry later"""
+        if not self.interval:
+            return
+        resume_at = asyncio.get_running_loop().time() + seconds
+        self._next_slot = max(self._next_slot, resume_at)
+
+
+_app_throttles: dict[str, RequestThrottle] = {}
 
 
 class Spotify:
     """Handle Spotify OAuth flow and API calls"""
 
-    def __init__(self, app_name: str = "lykd"):
+    def __init__(self, app_name: str = "lykd", client: httpx.AsyncClient | None = None):
         if app_name == "lykd":
             self.client_id = settings.SPOTIFY_CLIENT_ID
             self.client_secret = settings.SPOTIFY_CLIENT_SECRET
@@ -55,17 +105,19 @@ class Spotify:
         if not self.client_id or not self.client_secret:
             raise ValueError("Spotify credentials not found in environment variables")
 
-        # Initialize reusable HTTP client with connection pooling
-        self.client = httpx.AsyncClient(
-            verify=settings.HTTPS_VERIFY,
-            timeout=30.0,
-            limits=httpx.Limits(max_keepalive_connections=5, max_connections=10),
-        )
+        # Reusable HTTP client with connection pooling - a given client can be
+        # shared between instances (and it's closed by whoever created it)
+        self._owns_client = client is None
+        self.client = client or new_http_client()
         self.api_usage = 0  # track the number of API calls made
+        self.throttle = _app_throttles.setdefault(
+            self.client_id, RequestThrottle(settings.SPOTIFY_RPS)
+        )
 
     async def close(self):
-        """Explicitly close the HTTP client"""
-        await self.client.aclose()
+        """Explicitly close the HTTP client, unless it's a shared one"""
+        if self._owns_client:
+            await self.client.aclose()
 
     def get_authorization_url(self) -> tuple[str, str]:
         """Generate authorization URL and state for OAuth flow"""
@@ -230,25 +282,51 @@ class Spotify:
     async def get_all(
         *, user: User, request, db_session: Session, limit=50
     ) -> list[dict[str, Any]]:
-        """Get all liked songs for a user by iterating through all pages"""
-        items = []
-        next_page = None
-        while True:
-            response = await request(
-                user=user, db_session=db_session, limit=limit, next_page=next_page
-            )
-            page = response.get("items", [])
+        """Get all the items of a paginated endpoint.
 
-            if not page:
-                break
+        The first page tells the total: the following pages are then fetched
+        concurrently (PAGE_CONCURRENCY at a time) by offset, in order
+        """
+        response = await request(
+            user=user, db_session=db_session, limit=limit, next_page=None
+        )
+        items = response.get("items", [])
+        next_page = response.get("next")
+        total = response.get("total")
+        if not items or not next_page:
+            return items
+
+        if total is None:  # nothing to plan the pages with, follow the links
+            while next_page:
+                response = await request(
+                    user=user, db_session=db_session, limit=limit, next_page=next_page
+                )
+                page = response.get("items", [])
+                if not page:
+                    break
+                items.extend(page)
+                next_page = response.get("next")
+            return items
+
+        next_url = httpx.URL(next_page)
+        page_size = response.get("limit") or len(items)
+        semaphore = asyncio.Semaphore(PAGE_CONCURRENCY)
+
+        async def _get_page(offset: int) -> list[dict[str, Any]]:
+            async with semaphore:
+                page = await request(
+                    user=user,
+                    db_session=db_session,
+                    limit=limit,
+                    next_page=str(next_url.copy_set_param("offset", offset)),
+                )
+            return page.get("items", [])
 
+        pages = await asyncio.gather(
+            *(_get_page(offset) for offset in range(len(items), total, page_size))
+        )
+        for page in pages:
             items.extend(page)
-
-            # Check if there are more tracks
-            next_page = response.get("next")
-            if not next_page:
-                break
-
         return items
 
     @staticmethod
@@ -585,8 +663,15 @@ class Spotify:
             headers = kwargs.pop("headers", {})
             headers = {**self.get_headers(user), **headers}
             kwargs["headers"] = headers
+        await self.throttle.wait()
         response = await self.client.request(method, url, **kwargs)
         self.api_usage += 1
+        if response.status_code == 429:
+            # the limit is app-wide: hold the other requests as well
+            try:
+                self.throttle.pause(int(response.headers.get("Retry-After", 0)))
+            except ValueError:
+                pass
         if allowed_statuses:
             if response.status_code in allowed_statuses:
                 return response
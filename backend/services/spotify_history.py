@@ -1,31 +1,202 @@
+import asyncio
 import datetime as dt
 import json
 import logging
+import multiprocessing
 import shutil
 import tempfile
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-from sqlmodel import Session
+from sqlmodel import Session, or_, select, update
 
+import settings
 from models.auth import User
-from models.common import get_db
-from models.music import Play
+from models.common import get_db, get_engine
+from models.music import HistoryUpload, Play
+from services.cache import cache
 from services.spotify import Spotify
-from services.store import find_missing_tracks, store_track
+from services.store import find_missing_tracks, store_tracks
+from utils import setup_logs
 
 logger = logging.getLogger("lykd.spotify_import")
 PROGRESS_EVERY = 2_000
+# a claim older than this belongs to a process that died mid-import
+IMPORT_CLAIM_TIMEOUT = dt.timedelta(hours=1)
+# a ZIP failing this many times needs a look, stop retrying it
+IMPORT_MAX_ATTEMPTS = 3
+_import_pool: ProcessPoolExecutor | None = None
 
 
-async def process_spotify_history_zip(user: User, zip_path: str) -> None:
-    """Process a Spotify extended history ZIP in a background thread.
+def history_upload_path(user_id: str, upload_sha256: str) -> Path:
+    """Where an accepted history ZIP waits until it has been imported"""
+    return settings.HISTORY_IMPORTS_DIR / f"{user_id}_{upload_sha256}.zip"
+
+
+async def resume_pending_imports() -> None:
+    """Run again the imports interrupted by a restart, their ZIP is still on disk"""
+    with get_db() as session:
+        pending = session.exec(
+            select(HistoryUpload, User)
+            .join(User, User.id == HistoryUpload.user_id)
+            .where(
+                HistoryUpload.processed_at.is_(None),
+                HistoryUpload.attempts < IMPORT_MAX_ATTEMPTS,
+            )
+        ).all()
+    for history_upload, user in pending:
+        zip_path = history_upload_path(user.id, history_upload.sha256)
+        if not zip_path.exists():
+            continue
+        logger.info(f"Resuming the Spotify history import for user {user}")
+        try:
+            await process_spotify_history_zip(
+                user, str(zip_path), history_upload.sha256
+            )
+        except Exception:
+            # a bad upload doesn't hold back the others
+            logger.exception(f"Can't resume the Spotify history import for {user}")
+
+
+def get_import_pool() -> ProcessPoolExecutor:
+    """The process running the imports: parsing and inserting the plays is
+    CPU bound and would otherwise hold the GIL of the API process.
+
+    A single worker, SQLite has a single writer anyway. Spawned (not forked
+    from a process running an event loop and threads), configuring the logs.
+    """
+    global _import_pool
+    if _import_pool is None:
+        _import_pool = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=setup_logs,
+        )
+    return _import_pool
+
+
+def shutdown_import_pool() -> None:
+    global _import_pool
+    if _import_pool is not None:
+        # called from the lifespan: waiting for a running import would block the loop
+        _import_pool.shutdown(wait=False, cancel_futures=True)
+        _import_pool = None
+
+
+def claim_history_upload(session: Session, user_id: str, upload_sha256: str) -> bool:
+    """Mark the upload as being imported, True when this process got it.
+
+    A conditional UPDATE: with several API workers (and the import worker)
+    resuming the same uploads, only one of them sees its row changed.
+    """
+    now = dt.datetime.now(dt.timezone.utc)
+    # exec hands back the Core result: rowcount tells whether we got the claim
+    result = session.exec(
+        update(HistoryUpload)
+        .where(
+            HistoryUpload.user_id == user_id,
+            HistoryUpload.sha256 == upload_sha256,
+            HistoryUpload.processed_at.is_(None),
+            or_(
+                HistoryUpload.started_at.is_(None),
+                HistoryUpload.started_at < now - IMPORT_CLAIM_TIMEOUT,
+            ),
+        )
+        .values(started_at=now, attempts=HistoryUpload.attempts + 1)
+    )
+    session.commit()
+    return result.rowcount == 1
+
+
+def release_history_upload(session: Session, user_id: str, upload_sha256: str):
+    """Drop the claim of a failed import, so it's retried"""
+    session.exec(
+        update(HistoryUpload)
+        .where(
+            HistoryUpload.user_id == user_id,
+            HistoryUpload.sha256 == upload_sha256,
+        )
+        .values(started_at=None)
+    )
+    session.commit()
+
+
+def is_history_upload_processed(
+    session: Session, user_id: str, upload_sha256: str
+) -> bool:
+    """Read processed_at from the database, the import ran in another session"""
+    processed_at = session.exec(
+        select(HistoryUpload.processed_at).where(
+            HistoryUpload.user_id == user_id,
+            HistoryUpload.sha256 == upload_sha256,
+        )
+    ).first()
+    return processed_at is not None
+
+
+async def process_spotify_history_zip(
+    user: User, zip_path: str, upload_sha256: str | None = None
+) -> None:
+    """Import a Spotify extended history ZIP, the file is deleted when done.
+
+    The plays are imported in the import process (see get_import_pool), then
+    the tracks we don't know yet are fetched from Spotify.
+    When the import fails the ZIP stays on disk and the upload is released,
+    resume_pending_imports tries it again.
+    """
+    if upload_sha256:
+        claimed = False
+        with get_db() as session:
+            claimed = claim_history_upload(session, user.id, upload_sha256)
+        if not claimed:
+            logger.info(
+                f"The Spotify history import for user {user} is already running"
+            )
+            return
+
+    try:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            get_import_pool(), import_plays_from_zip, user.id, zip_path, upload_sha256
+        )
+        imported = upload_sha256 is None
+        if upload_sha256:
+            with get_db() as session:
+                imported = is_history_upload_processed(session, user.id, upload_sha256)
+    except Exception:
+        logger.exception(f"The Spotify history import failed for user {user}")
+        imported = False
+    if not imported:
+        if upload_sha256:
+            with get_db() as session:
+                release_history_upload(session, user.id, upload_sha256)
+        return
+
+    with get_db() as session:
+        await fill_missing_track(session, user)
+    cache.invalidate_stats(user.id)
+
+    try:
+        Path(zip_path).unlink(missing_ok=True)
+    except OSError:
+        logger.exception(f"Can't remove the imported Spotify history {zip_path}")
+
+
+def import_plays_from_zip(
+    user_id: str, zip_path: str, upload_sha256: str | None = None
+) -> tuple[int, int]:
+    """Store the plays of a Spotify extended history ZIP, returns the number
+    of inserted and skipped entries.
+
+    Runs in the import process: it takes plain ids, not ORM instances.
 
     Steps:
     - Extract to a temporary directory
     - Walk all .json files (any depth), sort by filename descending
     - For each JSON array item, create a Play record with date from ts and track_id from spotify_track_uri
     - Commit once at the end
+    - Mark the upload (by content hash) as processed, so re-uploads are skipped
     - Cleanup temp directory
     """
     work_dir = tempfile.mkdtemp(prefix="lykd_spotify_import_")
@@ -48,17 +219,20 @@ async def process_spotify_history_zip(user: User, zip_path: str) -> None:
                     )
                     continue
                 zf.extract(member, path=extract_dir)
-        logger.debug(f"Extracted ZIP for user {user} to {extract_dir}")
+        logger.debug(f"Extracted ZIP for user {user_id} to {extract_dir}")
 
         # Collect JSON files and sort by filename desc
         json_files = list(extract_dir.rglob("*.json"))
         json_files.sort(key=lambda p: p.name, reverse=True)
-        logger.debug(f"Found {len(json_files)} JSON files to process for user {user}")
+        logger.debug(
+            f"Found {len(json_files)} JSON files to process for user {user_id}"
+        )
 
         inserted = 0
         skipped = 0
 
-        with get_db() as session:
+        # not get_db: it would swallow a failed commit, and the ZIP be deleted
+        with Session(get_engine(), expire_on_commit=False) as session:
             for jf in json_files:
                 try:
                     with open(jf, "r", encoding="utf-8") as f:
@@ -72,7 +246,7 @@ async def process_spotify_history_zip(user: User, zip_path: str) -> None:
                     continue
 
                 logger.debug(
-                    f"Processing file {jf.name} with {len(data)} entries for user {user}"
+                    f"Processing file {jf.name} with {len(data)} entries for user {user_id}"
                 )
 
                 for item in data:
@@ -97,12 +271,12 @@ async def process_spotify_history_zip(user: User, zip_path: str) -> None:
 
                         # Upsert-like insert using merge to avoid PK conflicts; commit done at end
                         session.merge(
-                            Play(user_id=user.id, track_id=track_id, date=dt_utc)
+                            Play(user_id=user_id, track_id=track_id, date=dt_utc)
                         )
                         inserted += 1
                         if inserted % PROGRESS_EVERY == 0:
                             logger.debug(
-                                f"Progress for user {user}: processed={inserted}(file={jf.name})"
+                                f"Progress for user {user_id}: processed={inserted}(file={jf.name})"
                             )
                     except Exception as e:
                         logger.exception(f"Error processing item in {jf}: {e}")
@@ -110,24 +284,20 @@ async def process_spotify_history_zip(user: User, zip_path: str) -> None:
                         continue
             # One commit at the end per requirements
             logger.debug(
-                f"Committing plays for user {user}: inserted={inserted} skipped={skipped}"
+                f"Committing plays for user {user_id}: inserted={inserted} skipped={skipped}"
             )
+            if upload_sha256:
+                history_upload = session.get(HistoryUpload, (user_id, upload_sha256))
+                if history_upload:
+                    history_upload.processed_at = dt.datetime.now(dt.timezone.utc)
             session.commit()
 
             logger.info(
-                f"Spotify import finished for user {user}: inserted={inserted} skipped={skipped}"
+                f"Spotify import finished for user {user_id}: inserted={inserted} skipped={skipped}"
             )
-            await fill_missing_track(session, user)
     finally:
-        try:
-            shutil.rmtree(work_dir, ignore_errors=True)
-        except Exception:
-            pass
-        try:
-            if zip_path and Path(zip_path).exists():
-                Path(zip_path).unlink(missing_ok=True)
-        except Exception:
-            pass
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return inserted, skipped
 
 
 async def fill_missing_track(session: Session, user: User):
@@ -135,9 +305,12 @@ async def fill_missing_track(session: Session, user: User):
     if missing_tracks:
         logger.info(f"Querying Spotify for {len(missing_tracks)} missing tracks")
         spotify = Spotify()
-        async for track in spotify.yield_tracks(
-            user=user, db_session=session, tracks=missing_tracks
-        ):
-            store_track(track, session)
+        tracks = [
+            track
+            async for track in spotify.yield_tracks(
+                user=user, db_session=session, tracks=missing_tracks
+            )
+        ]
+        store_tracks(tracks, session)
     session.commit()
     logger.info("Finished filling the track gaps from Spotify")
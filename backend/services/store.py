@@ -1,3 +1,4 @@
+from sqlalchemy.dialects.sqlite import insert
 from sqlmodel import Session, delete, select, update
 
 from models.auth import User
@@ -14,100 +15,129 @@ from models.music import (
 )
 import logging
 
+from utils.chunks import chunked
 from utils.dates import parse_date
 
 logger = logging.getLogger("lykd.store")
+DELETE_CHUNK_SIZE = 500
+
+
+def _artist_row(artist_data: dict) -> dict | None:
+    if not artist_data.get("id") or not artist_data.get("name"):
+        logger.error(f"Invalid artist data, skipping: {artist_data}")
+        return None
+    return dict(
+        id=artist_data["id"],
+        name=artist_data["name"],
+        picture=artist_data.get("picture"),
+        uri=artist_data.get("uri"),
+    )
 
 
-def store_track(track, db_session: Session):
-    """Store a track and its related data using SQLModel merge for efficient upserts"""
-    artists = []
-    for artist_data in track.get("artists", []):
-        if not artist_data.get("id") or not artist_data.get("name"):
-            logger.error(f"Invalid artist data, skipping: {artist_data}")
-            continue
-        # Create artist instance and merge (upsert)
-        try:
-            artist = Artist(
-                id=artist_data["id"],
-                name=artist_data["name"],
-                picture=artist_data.get("picture"),
-                uri=artist_data.get("uri"),
-            )
-            merged_artist = db_session.merge(artist)
-            artists.append(merged_artist)
-        except Exception as e:
-            logger.error(f"Error storing Artist: {e} - {artist_data}")
+def _album_row(album_data: dict) -> dict:
+    try:
+        release_date = (
+            parse_date(album_data["release_date"]).date()
+            if album_data.get("release_date")
+            else None
+        )
+    except Exception:
+        logger.error(f"Error parsing album release date: {album_data['release_date']}")
+        release_date = None
+    return dict(
+        id=album_data["id"],
+        name=album_data["name"],
+        release_date=release_date,
+        release_date_precision=album_data.get("release_date_precision"),
+        picture=album_data["images"][0]["url"] if album_data.get("images") else None,
+        uri=album_data.get("uri"),
+    )
 
-    album = None
-    if track.get("album"):
-        album_data = track["album"]
 
-        # Create album instance and merge (upsert)
+def _upsert(db_session: Session, model, rows: list[dict]):
+    """Insert or update the rows (all the columns but the primary key)"""
+    if not rows:
+        return
+    stmt = insert(model)
+    update_columns = {
+        column.name: stmt.excluded[column.name]
+        for column in model.__table__.columns
+        if not column.primary_key
+    }
+    if update_columns:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[c.name for c in model.__table__.primary_key],
+            set_=update_columns,
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing()
+    # a list of parameters: executemany, batched by SQLAlchemy
+    db_session.exec(stmt, params=rows)
+
+
+def store_tracks(tracks: list[dict], db_session: Session):
+    """Store the tracks and their related data (albums, artists and their links)
+    with an upsert statement per table, rather than a merge per object.
+    When a track, album or artist comes more than once, the last one wins.
+    """
+    artists: dict[str, dict] = {}
+    albums: dict[str, dict] = {}
+    album_artists: set[tuple[str, str]] = set()
+    track_rows: dict[str, dict] = {}
+    track_artists: set[tuple[str, str]] = set()
+
+    for track in tracks:
         try:
-            try:
-                release_date = (
-                    parse_date(album_data["release_date"]).date()
-                    if album_data.get("release_date")
-                    else None
-                )
-            except Exception:
-                logger.error(
-                    f"Error parsing album release date: {album_data['release_date']}"
-                )
-                release_date = None
-            album = Album(
-                id=album_data["id"],
-                name=album_data["name"],
-                release_date=release_date,
-                release_date_precision=album_data.get("release_date_precision"),
-                picture=album_data["images"][0]["url"]
-                if album_data.get("images")
-                else None,
-                uri=album_data.get("uri"),
+            track_row = dict(
+                id=track["id"],
+                title=track["name"],
+                duration=track["duration_ms"],
+                album_id=None,
+                uri=track["uri"],
             )
-            album = db_session.merge(album)
         except Exception as e:
-            logger.error(f"Error storing album: {e} - {album_data}")
+            logger.error(f"Error storing track {track.get('name', 'Unknown')}: {e}")
+            continue
+
+        for artist_data in track.get("artists", []):
+            if artist := _artist_row(artist_data):
+                artists[artist["id"]] = artist
+                track_artists.add((track_row["id"], artist["id"]))
 
-        # Handle album artists
-        for artist_data in album_data.get("artists", []):
-            if not artist_data.get("id") or not artist_data.get("name"):
-                logger.error(f"Invalid album artist data, skipping: {artist_data}")
-                continue
+        if album_data := track.get("album"):
             try:
-                # Create/merge album artist
-                album_artist = Artist(
-                    id=artist_data["id"],
-                    name=artist_data["name"],
-                    picture=artist_data.get("picture"),
-                )
-                merged_album_artist = db_session.merge(album_artist)
-
-                # Create/merge album-artist relationship
-                album_artist_relation = AlbumArtist(
-                    album_id=album.id, artist_id=merged_album_artist.id
-                )
-                db_session.merge(album_artist_relation)
+                album = _album_row(album_data)
             except Exception as e:
-                logger.error(f"Error storing album artist: {e} - {artist_data}")
-
-    # Create track instance and merge (upsert)
-    t = Track(
-        id=track["id"],
-        title=track["name"],
-        duration=track["duration_ms"],
-        album_id=album.id if album else None,
-        uri=track["uri"],
+                logger.error(f"Error storing album: {e} - {album_data}")
+            else:
+                albums[album["id"]] = album
+                track_row["album_id"] = album["id"]
+                for artist_data in album_data.get("artists", []):
+                    if artist := _artist_row(artist_data):
+                        artists[artist["id"]] = artist
+                        album_artists.add((album["id"], artist["id"]))
+
+        track_rows[track_row["id"]] = track_row
+
+    _upsert(db_session, Artist, list(artists.values()))
+    _upsert(db_session, Album, list(albums.values()))
+    _upsert(
+        db_session,
+        AlbumArtist,
+        [dict(album_id=al, artist_id=ar) for al, ar in album_artists],
+    )
+    _upsert(db_session, Track, list(track_rows.values()))
+    _upsert(
+        db_session,
+        TrackArtist,
+        [dict(track_id=t, artist_id=ar) for t, ar in track_artists],
     )
-    t = db_session.merge(t)
 
-    # Handle track artists relationships
-    for artist in artists:
-        track_artist_relation = TrackArtist(track_id=t.id, artist_id=artist.id)
-        db_session.merge(track_artist_relation)
 
-    return t
+def insert_plays(plays: list[dict], db_session: Session):
+    """Insert the plays, skipping the ones already stored"""
+    if plays:
+        db_session.exec(insert(Play).on_conflict_do_nothing(), params=plays)
 
 
 def store_playlist(playlist: dict, db_session: Session):
@@ -137,15 +167,15 @@ def update_playlist_db(
     db: Session,
     snapshot_id: str | None = None,
 ):
-    if tracks_to_remove:
+    # keep each DELETE within SQLite's limit of bound parameters
+    for track_ids in chunked(tracks_to_remove, DELETE_CHUNK_SIZE):
         db.exec(
             delete(PlaylistTrack).where(
                 PlaylistTrack.playlist_id == playlist_id,
-                PlaylistTrack.track_id.in_(tuple(tracks_to_remove)),
+                PlaylistTrack.track_id.in_(track_ids),
             )
         )
-    for playlist_track in tracks_to_add:
-        db.merge(playlist_track)
+    _upsert(db, PlaylistTrack, [pt.model_dump() for pt in tracks_to_add])
     if snapshot_id is not None:
         logger.debug(
             f"Setting the snapshot {snapshot_id} for the changed playlist {playlist_id}"
@@ -160,15 +190,15 @@ def update_playlist_db(
 def update_likes_db(
     user: User, likes_to_add: list[Like], tracks_to_remove: set[str], db: Session
 ):
-    if tracks_to_remove:
+    # keep each DELETE within SQLite's limit of bound parameters
+    for track_ids in chunked(tracks_to_remove, DELETE_CHUNK_SIZE):
         db.exec(
             delete(Like).where(
                 Like.user_id == user.id,
-                Like.track_id.in_(tuple(tracks_to_remove)),
+                Like.track_id.in_(track_ids),
             )
         )
-    for like in likes_to_add:
-        db.merge(like)
+    _upsert(db, Like, [like.model_dump() for like in likes_to_add])
 
 
 def find_missing_tracks(session: Session):
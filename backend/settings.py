@@ -21,6 +21,17 @@ BACKEND_DIR = Path(__file__).parent
 DATABASE_PATH = BACKEND_DIR / "lykd.sqlite"
 DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{DATABASE_PATH}")
 PROJECT_PATH = BACKEND_DIR.parent
+# accepted history ZIPs wait here until imported, so restarts can resume them
+HISTORY_IMPORTS_DIR = Path(os.getenv("HISTORY_IMPORTS_DIR", BACKEND_DIR / "imports"))
+# leave the imports to scripts/import_history.py, out of the API workers
+HISTORY_IMPORT_WORKER = parse_bool(os.getenv("HISTORY_IMPORT_WORKER", False))
+# users synced at once by scripts/fetch_data.py, higher risks Spotify 429s
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "3"))
+# Spotify API requests per second, per app and process (0 to disable)
+SPOTIFY_RPS = float(os.getenv("SPOTIFY_RPS", "10"))
+# uvicorn processes of run_server.py, caches and rate limits are per process
+# (the history imports are claimed in the database, any worker can run them)
+API_WORKERS = int(os.getenv("API_WORKERS", "2"))
 
 TESTING_MODE = parse_bool(os.getenv("TESTING_MODE", False))  # don't wait on retries
 CACHE_ENABLED = parse_bool(os.getenv("CACHE_ENABLED", False))
@@ -6,6 +6,7 @@ import sys
 import pathlib
 import pytest
 import tempfile
+from contextlib import contextmanager
 from unittest.mock import patch
 
 from fastapi import FastAPI
@@ -27,6 +28,7 @@ os.environ["LYKD_CLIENT_SECRET"] = "test_client_secret"
 os.environ["SESSION_SECRET_KEY"] = "test_secret_key"
 os.environ["TESTING_MODE"] = "True"
 os.environ["CACHE_ENABLED"] = "False"
+os.environ["SPOTIFY_RPS"] = "0"
 os.environ["SLACK_TOKEN"] = ""
 os.environ["API_PREFIX"] = ""
 
@@ -66,6 +68,20 @@ def test_session(test_engine):
         yield session
 
 
+@pytest.fixture
+def history_db(test_engine, test_session, mocker):
+    """Run the history imports on the test database."""
+    from services import spotify_history
+
+    @contextmanager
+    def _get_db():
+        yield test_session
+
+    mocker.patch.object(spotify_history, "get_db", _get_db)
+    mocker.patch.object(spotify_history, "get_engine", return_value=test_engine)
+    return test_session
+
+
 @pytest.fixture
 def override_get_session(test_session):
     """Override the get_session dependency for testing."""
@@ -211,6 +227,22 @@ def temp_file():
     os.unlink(f.name)
 
 
+@pytest.fixture(autouse=True)
+def reset_rate_limits():
+    """Rate limits are process-wide: don't let them leak between tests."""
+    from routes.spotify_route import authorize_rate_limit
+
+    authorize_rate_limit.hits.clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_track_cache():
+    """The tests reuse the track ids: don't serve a track cached by another test."""
+    from services.cache import cache
+
+    cache.track_cache.clear()
+
+
 @pytest.fixture(autouse=True)
 def reset_database_state(test_session):
     """Reset database state after each test."""
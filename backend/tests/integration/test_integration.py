@@ -3,6 +3,8 @@
 import pytest
 from unittest.mock import patch
 
+from sqlmodel import select
+
 
 class TestSpotifyOAuthIntegration:
     """Test complete Spotify OAuth integration flow."""
@@ -119,6 +121,58 @@ class TestSpotifyOAuthIntegration:
         assert test_user.tokens["access_token"] != original_token
         assert test_user.name == "Updated Name"
 
+    @pytest.mark.asyncio
+    async def test_oauth_state_cannot_be_replayed(
+        self, client, test_session, httpx_mock, mocker
+    ):
+        """A state is consumed by the first callback and rejected afterwards."""
+        from models.auth import OAuthState, hash_oauth_state
+
+        send_message = mocker.patch("routes.spotify_route.slack.send_message")
+
+        state = client.get("/spotify/authorize").json()["state"]
+
+        httpx_mock.add_response(
+            method="POST",
+            url="https://accounts.spotify.com/api/token",
+            json={"access_token": "replay_token", "expires_in": 3600},
+            status_code=200,
+        )
+        httpx_mock.add_response(
+            method="GET",
+            url="https://api.spotify.com/v1/me",
+            json={
+                "id": "replay_user",
+                "display_name": "Replay",
+                "email": "replay@example.com",
+            },
+            status_code=200,
+        )
+
+        first = client.get(
+            f"/spotify/callback?code=test_code&state={state}", follow_redirects=False
+        )
+        assert "spotify=connected" in first.headers["location"]
+        # the new-user notification runs as a background task, after the redirect
+        send_message.assert_called_once()
+        assert "New user connected" in send_message.call_args.args[0]
+
+        oauth_state = (
+            test_session.query(OAuthState)
+            .filter(OAuthState.state_hash == hash_oauth_state(state))
+            .one()
+        )
+        test_session.refresh(oauth_state)
+        assert oauth_state.consumed_at is not None
+        assert oauth_state.attempt_count == 1
+        assert oauth_state.user_id == "replay_user"
+
+        second = client.get(
+            f"/spotify/callback?code=test_code&state={state}", follow_redirects=False
+        )
+        assert second.status_code == 302
+        assert "Invalid%20or%20expired%20state" in second.headers["location"]
+
     def test_protected_endpoints_without_auth(self, client):
         """Test that protected endpoints work properly without authentication."""
         # /user/me should return null user when not authenticated
@@ -262,3 +316,25 @@ class TestApplicationConfiguration:
         assert os.getenv("TESTING") == "true"
         assert os.getenv("LYKD_CLIENT_ID") == "test_client_id"
         assert os.getenv("DATABASE_URL") == "sqlite:///:memory:"
+
+
+def test_spotify_authorize_is_rate_limited(client):
+    from routes.spotify_route import authorize_rate_limit
+
+    for _ in range(authorize_rate_limit.times):
+        assert client.get("/spotify/authorize").status_code == 200
+    assert client.get("/spotify/authorize").status_code == 429
+
+
+def test_spotify_authorize_stores_hashed_state(client, test_session):
+    from models.auth import OAUTH_STATE_TTL, OAuthState, hash_oauth_state
+
+    state = client.get("/spotify/authorize").json()["state"]
+
+    oauth_state = test_session.exec(
+        select(OAuthState).where(OAuthState.state_hash == hash_oauth_state(state))
+    ).one()
+    assert oauth_state.provider == "spotify"
+    assert oauth_state.attempt_count == 0
+    assert oauth_state.consumed_at is None
+    assert oauth_state.expires_at - oauth_state.created_at == OAUTH_STATE_TTL
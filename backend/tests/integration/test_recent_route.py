@@ -173,3 +173,52 @@ def test_recent_search_by_date_tokens(
     assert all(it["date"].startswith("2013-08") for it in items)
 
     del test_app.dependency_overrides[get_current_user]
+
+
+def test_like_updates_cached_likes(
+    client, test_app, auth_override, test_user, test_session, mocker
+):
+    from routes.recent_route import get_spotify_client
+    from services.cache import cache
+
+    test_session.add(Track(id="t1", title="T1", duration=1000))
+    test_session.commit()
+    spotify = mocker.Mock(set_liked_track=mocker.AsyncMock())
+    test_app.dependency_overrides[get_spotify_client] = lambda: spotify
+    try:
+        assert cache.get_likes(test_user, test_session) == frozenset()
+
+        r = client.post("/like", json={"track_id": "t1", "liked": True})
+        assert r.status_code == 200
+        assert cache.likes_cache[test_user.id] == {"t1"}
+
+        r = client.post("/like", json={"track_id": "t1", "liked": False})
+        assert r.status_code == 200
+        assert cache.likes_cache[test_user.id] == frozenset()
+    finally:
+        del test_app.dependency_overrides[get_spotify_client]
+        cache.likes_cache.pop(test_user.id, None)
+
+
+def test_enrich_tracks_caches_known_tracks(test_session, test_user):
+    from services.cache import cache
+
+    test_session.add(Track(id="t1", title="T1", duration=1000))
+    test_session.commit()
+    items = [
+        Play(
+            user_id=test_user.id, track_id=tid, date=datetime.datetime.now(timezone.utc)
+        )
+        for tid in ("t1", "unknown")
+    ]
+
+    first = cache.enrich_tracks(items, "date", None, test_session)
+    assert [i["track"]["title"] for i in first] == ["T1", None]
+    assert "t1" in cache.track_cache
+    # tracks not in the DB yet are looked up again next time
+    assert "unknown" not in cache.track_cache
+
+    test_session.get(Track, "t1").title = "Renamed"
+    test_session.commit()
+    second = cache.enrich_tracks(items, "date", None, test_session)
+    assert second[0]["track"]["title"] == "T1"
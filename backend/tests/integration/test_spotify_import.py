@@ -0,0 +1,269 @@
+import datetime
+import hashlib
+import io
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from models.music import HistoryUpload
+
+
+@pytest.fixture(autouse=True)
+def imports_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr("settings.HISTORY_IMPORTS_DIR", tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def process_zip(mocker):
+    """Capture the background job instead of running the import"""
+    received = {}
+
+    async def _process(user, zip_file, upload_sha256=None):
+        received["user_id"] = user.id
+        received["sha256"] = upload_sha256
+        received["content"] = Path(zip_file).read_bytes()
+
+    mocker.patch("routes.spotify_route.process_spotify_history_zip", _process)
+    return received
+
+
+def _zip_bytes() -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("Streaming_History_Audio_2024.json", "[]")
+    return buf.getvalue()
+
+
+def test_import_saves_upload_and_schedules_job(
+    client, auth_override, test_user, process_zip, imports_dir
+):
+    payload = _zip_bytes()
+    r = client.post(
+        "/spotify/import",
+        files={"file": ("history.zip", payload, "application/zip")},
+    )
+    assert r.status_code == 200
+    assert r.json() == {"message": "Import started"}
+    assert process_zip["user_id"] == test_user.id
+    assert process_zip["content"] == payload
+    assert process_zip["sha256"] == hashlib.sha256(payload).hexdigest()
+    # the ZIP stays on disk until imported, so the job can be resumed
+    assert [p.name for p in imports_dir.iterdir()] == [
+        f"{test_user.id}_{process_zip['sha256']}.zip"
+    ]
+
+
+def test_import_skips_already_processed_zip(
+    client, auth_override, test_user, test_session, process_zip, imports_dir
+):
+    payload = _zip_bytes()
+    test_session.add(
+        HistoryUpload(
+            user_id=test_user.id,
+            sha256=hashlib.sha256(payload).hexdigest(),
+            processed_at=datetime.datetime.now(datetime.timezone.utc),
+        )
+    )
+    test_session.commit()
+
+    r = client.post(
+        "/spotify/import",
+        files={"file": ("history.zip", payload, "application/zip")},
+    )
+    assert r.status_code == 200
+    assert r.json() == {"message": "Already imported"}
+    assert process_zip == {}
+    assert not list(imports_dir.iterdir())
+
+
+def test_import_rejects_non_zip(client, auth_override, process_zip):
+    r = client.post(
+        "/spotify/import",
+        files={"file": ("history.zip", b"not a zip at all", "application/zip")},
+    )
+    assert r.status_code == 400
+    assert process_zip == {}
+
+
+def test_import_rejects_zip_magic_with_broken_archive(
+    client, auth_override, process_zip, imports_dir
+):
+    r = client.post(
+        "/spotify/import",
+        files={"file": ("history.zip", b"PK\x03\x04garbage", "application/zip")},
+    )
+    assert r.status_code == 400
+    assert process_zip == {}
+    # the partial upload is removed
+    assert not list(imports_dir.iterdir())
+
+
+async def test_resume_pending_imports(
+    test_user, test_session, history_db, imports_dir, mocker
+):
+    from services import spotify_history
+
+    process = mocker.patch.object(spotify_history, "process_spotify_history_zip")
+
+    test_session.add_all(
+        [
+            HistoryUpload(user_id=test_user.id, sha256="pending"),
+            HistoryUpload(user_id=test_user.id, sha256="no-file"),
+            HistoryUpload(user_id=test_user.id, sha256="failing", attempts=3),
+            HistoryUpload(
+                user_id=test_user.id,
+                sha256="done",
+                processed_at=datetime.datetime.now(datetime.timezone.utc),
+            ),
+        ]
+    )
+    test_session.commit()
+    for sha256 in ("pending", "done", "failing"):
+        (imports_dir / f"{test_user.id}_{sha256}.zip").write_bytes(_zip_bytes())
+
+    await spotify_history.resume_pending_imports()
+
+    process.assert_awaited_once()
+    user, zip_path, sha256 = process.await_args.args
+    assert user.id == test_user.id
+    assert zip_path == str(imports_dir / f"{test_user.id}_pending.zip")
+    assert sha256 == "pending"
+
+
+async def test_resume_pending_imports_survives_a_failure(
+    test_user, test_session, history_db, imports_dir, mocker
+):
+    from services import spotify_history
+
+    process = mocker.patch.object(
+        spotify_history,
+        "process_spotify_history_zip",
+        side_effect=[RuntimeError("bad upload"), None],
+    )
+    for sha256 in ("first", "second"):
+        test_session.add(HistoryUpload(user_id=test_user.id, sha256=sha256))
+        (imports_dir / f"{test_user.id}_{sha256}.zip").write_bytes(_zip_bytes())
+    test_session.commit()
+
+    await spotify_history.resume_pending_imports()
+
+    assert process.await_count == 2
+
+
+def test_import_left_to_the_worker(
+    client, auth_override, test_user, process_zip, imports_dir, monkeypatch
+):
+    monkeypatch.setattr("settings.HISTORY_IMPORT_WORKER", True)
+    r = client.post(
+        "/spotify/import",
+        files={"file": ("history.zip", _zip_bytes(), "application/zip")},
+    )
+    assert r.status_code == 200
+    # nothing runs in-process: the ZIP waits on disk for scripts/import_history.py
+    assert process_zip == {}
+    assert len(list(imports_dir.glob(f"{test_user.id}_*.zip"))) == 1
+
+
+async def test_process_zip_imports_plays(
+    test_user, test_session, history_db, imports_dir, mocker
+):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from sqlmodel import select
+
+    from models.music import Play
+    from services import spotify_history
+
+    # the import process can't see the in-memory test DB: run it in a thread
+    mocker.patch.object(
+        spotify_history, "get_import_pool", return_value=ThreadPoolExecutor(1)
+    )
+    fill = mocker.patch.object(spotify_history, "fill_missing_track")
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr(
+            "Streaming_History_Audio_2024.json",
+            '[{"ts": "2024-01-02T03:04:05Z", "spotify_track_uri": "spotify:track:t1"},'
+            ' {"ts": "2024-01-02T03:04:05Z", "spotify_track_uri": "spotify:episode:e1"}]',
+        )
+    test_session.add(HistoryUpload(user_id=test_user.id, sha256="abc"))
+    test_session.commit()
+    zip_path = imports_dir / f"{test_user.id}_abc.zip"
+    zip_path.write_bytes(buf.getvalue())
+
+    await spotify_history.process_spotify_history_zip(test_user, str(zip_path), "abc")
+
+    plays = test_session.exec(select(Play).where(Play.user_id == test_user.id)).all()
+    assert [p.track_id for p in plays] == ["t1"]
+    assert test_session.get(HistoryUpload, (test_user.id, "abc")).processed_at
+    fill.assert_awaited_once()
+    assert not zip_path.exists()
+
+
+async def test_process_zip_failed_commit_keeps_the_upload(
+    test_user, test_session, history_db, imports_dir, mocker
+):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from sqlalchemy.exc import OperationalError
+    from sqlmodel import Session
+
+    from services import spotify_history
+
+    mocker.patch.object(
+        spotify_history, "get_import_pool", return_value=ThreadPoolExecutor(1)
+    )
+    fill = mocker.patch.object(spotify_history, "fill_missing_track")
+    test_session.add(HistoryUpload(user_id=test_user.id, sha256="abc"))
+    test_session.commit()
+    zip_path = imports_dir / f"{test_user.id}_abc.zip"
+    zip_path.write_bytes(_zip_bytes())
+
+    # the import's own session can't commit, another writer holds the lock
+    commit = Session.commit
+
+    def locked_commit(session):
+        if session is not test_session:
+            raise OperationalError("COMMIT", {}, Exception("database is locked"))
+        commit(session)
+
+    mocker.patch.object(Session, "commit", locked_commit)
+
+    await spotify_history.process_spotify_history_zip(test_user, str(zip_path), "abc")
+
+    # released for a retry, the ZIP is still there
+    history_upload = test_session.get(HistoryUpload, (test_user.id, "abc"))
+    test_session.refresh(history_upload)
+    assert history_upload.processed_at is None
+    assert history_upload.started_at is None
+    assert history_upload.attempts == 1
+    fill.assert_not_called()
+    assert zip_path.exists()
+
+
+async def test_process_zip_skips_claimed_upload(
+    test_user, test_session, history_db, imports_dir, mocker
+):
+    from services import spotify_history
+
+    pool = mocker.patch.object(spotify_history, "get_import_pool")
+    test_session.add(
+        HistoryUpload(
+            user_id=test_user.id,
+            sha256="abc",
+            started_at=datetime.datetime.now(datetime.timezone.utc),
+            attempts=1,
+        )
+    )
+    test_session.commit()
+    zip_path = imports_dir / f"{test_user.id}_abc.zip"
+    zip_path.write_bytes(_zip_bytes())
+
+    # another process is importing it
+    await spotify_history.process_spotify_history_zip(test_user, str(zip_path), "abc")
+
+    pool.assert_not_called()
+    assert zip_path.exists()
@@ -3,6 +3,7 @@ from functools import partial
 import httpx
 
 from models import User
+from services.cache import cache
 from services.spotify import Spotify, get_spotify_client
 
 
@@ -70,3 +71,65 @@ def test_spotify_playback_refresh_on_401(
     # Clean up dependency overrides
     del test_app.dependency_overrides[current_user]
     del test_app.dependency_overrides[get_spotify_client]
+
+
+def test_spotify_play_returns_track(client, test_user, test_app, httpx_mock):
+    cache.spotify_track_cache.clear()
+    httpx_mock.add_response(
+        method="PUT", url="https://api.spotify.com/v1/me/player/play", status_code=204
+    )
+    httpx_mock.add_response(
+        method="GET",
+        url="https://api.spotify.com/v1/tracks/t1",
+        json={
+            "id": "t1",
+            "name": "Test Song",
+            "artists": [{"name": "Artist"}],
+            "album": {"images": [{"url": "https://example.com/cover.jpg"}]},
+            "duration_ms": 1000,
+        },
+    )
+
+    from routes.deps import current_user
+
+    test_app.dependency_overrides[current_user] = lambda: test_user
+    test_app.dependency_overrides[get_spotify_client] = lambda: Spotify()
+
+    response = client.post("/spotify/play", json={"track_id": "t1"})
+    assert response.status_code == 200
+    assert response.json() == {
+        "status": "ok",
+        "track": {
+            "id": "t1",
+            "name": "Test Song",
+            "artists": ["Artist"],
+            "album_image": "https://example.com/cover.jpg",
+            "duration_ms": 1000,
+        },
+    }
+
+    # track details are cached: replaying only sends the play command
+    httpx_mock.add_response(
+        method="PUT", url="https://api.spotify.com/v1/me/player/play", status_code=204
+    )
+    response = client.post("/spotify/play", json={"track_id": "t1"})
+    assert response.json()["track"]["name"] == "Test Song"
+
+    # a failed playback wins over the track lookup
+    httpx_mock.add_response(
+        method="PUT",
+        url="https://api.spotify.com/v1/me/player/play",
+        status_code=404,
+        json={
+            "error": {
+                "status": 404,
+                "message": "Player command failed: No active device found",
+            }
+        },
+    )
+    response = client.post("/spotify/play", json={"track_id": "t1"})
+    assert response.status_code == 404
+
+    del test_app.dependency_overrides[current_user]
+    del test_app.dependency_overrides[get_spotify_client]
+    cache.spotify_track_cache.clear()
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from models.music import Like, Play, Track
+from services.cache import cache
+
+
+@pytest.fixture(autouse=True)
+def clear_stats_cache():
+    cache.stats_cache.clear()
+    yield
+    cache.stats_cache.clear()
+
+
+def test_spotify_stats_empty(client, auth_override):
+    r = client.get("/spotify/stats")
+    assert r.status_code == 200
+    data = r.json()
+    assert data["total_likes_synced"] == 0
+    assert data["total_plays_synced"] == 0
+    assert data["tracking_since"] is None
+    assert data["active"] is True
+
+
+def test_spotify_stats_counts(client, auth_override, test_user, test_session):
+    now = datetime.now(timezone.utc)
+    test_session.add_all(
+        [
+            Track(id="t1", title="T1", duration=1000),
+            Track(id="t2", title="T2", duration=1000),
+        ]
+    )
+    test_session.add(Like(user_id=test_user.id, track_id="t1", date=now))
+    for days_ago in (30, 3, 1):
+        test_session.add(
+            Play(
+                user_id=test_user.id,
+                track_id="t2",
+                date=now - timedelta(days=days_ago),
+            )
+        )
+    test_session.commit()
+
+    r = client.get("/spotify/stats")
+    assert r.status_code == 200
+    data = r.json()
+    assert data["total_likes_synced"] == 1
+    assert data["total_plays_synced"] == 3
+    assert data["tracking_since"].startswith(
+        (now - timedelta(days=30)).date().isoformat()
+    )
+
+
+def test_spotify_stats_cached_until_invalidated(
+    client, auth_override, test_user, test_session
+):
+    assert client.get("/spotify/stats").json()["total_likes_synced"] == 0
+
+    test_session.add(Track(id="t1", title="T1", duration=1000))
+    test_session.add(
+        Like(user_id=test_user.id, track_id="t1", date=datetime.now(timezone.utc))
+    )
+    test_session.commit()
+
+    # still served from the cache
+    assert client.get("/spotify/stats").json()["total_likes_synced"] == 0
+
+    cache.invalidate_stats(test_user.id)
+    assert client.get("/spotify/stats").json()["total_likes_synced"] == 1
@@ -49,6 +49,38 @@ class TestAppEndpoints:
         # Clean up dependency override
         del test_app.dependency_overrides[get_current_user]
 
+    def test_routes_registered_once(self):
+        """Every path/method pair is served by a single handler."""
+        from fastapi.routing import APIRoute
+
+        from app import (
+            auth_router,
+            friendship_router,
+            ignore_router,
+            public_router,
+            recent_router,
+            spotify_router,
+            streaming_router,
+        )
+
+        seen = set()
+        for router in (
+            auth_router,
+            spotify_router,
+            public_router,
+            friendship_router,
+            recent_router,
+            ignore_router,
+            streaming_router,
+        ):
+            for route in router.routes:
+                if not isinstance(route, APIRoute):
+                    continue
+                for method in route.methods:
+                    assert (route.path, method) not in seen
+                    seen.add((route.path, method))
+        assert ("/spotify/playback", "GET") in seen
+
     def test_logout_endpoint(self, client):
         """Test logout endpoint clears session."""
         response = client.post("/logout")
@@ -4,7 +4,7 @@ import itertools
 import math
 import pytest
 
-from utils.chunks import reverse_block_chunks
+from utils.chunks import abatched, chunked, reverse_block_chunks
 
 
 class TestReverseBlockChunks:
@@ -60,3 +60,27 @@ class TestReverseBlockChunks:
         gen = reverse_block_chunks([1, 2, 3], size)
         # Don't iterate the generator; just confirm it's a generator
         assert hasattr(gen, "__iter__") and not isinstance(gen, list)
+
+
+class TestChunked:
+    def test_keeps_order(self):
+        assert list(chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+
+    def test_exact_multiple(self):
+        assert list(chunked([1, 2, 3, 4], 2)) == [[1, 2], [3, 4]]
+
+    def test_empty(self):
+        assert list(chunked([], 3)) == []
+
+    def test_consumes_iterators_lazily(self):
+        chunks = chunked(itertools.count(), 3)
+        assert next(chunks) == [0, 1, 2]
+        assert next(chunks) == [3, 4, 5]
+
+
+async def test_abatched():
+    async def numbers():
+        for n in range(5):
+            yield n
+
+    assert [batch async for batch in abatched(numbers(), 2)] == [[0, 1], [2, 3], [4]]
@@ -0,0 +1,58 @@
+import smtplib
+
+import pytest
+
+from services import email as email_service
+
+
+@pytest.fixture
+def smtp(mocker, monkeypatch):
+    monkeypatch.setattr("settings.TESTING_MODE", False)
+    monkeypatch.setattr("settings.SMTP_HOST", "smtp.example.com")
+    monkeypatch.setattr("settings.SMTP_USERNAME", "user")
+    monkeypatch.setattr("settings.SMTP_PASSWORD", "secret")
+    smtp = mocker.patch("smtplib.SMTP")
+    yield smtp
+    email_service.smtp_connection.close()
+
+
+def test_send_email_delivers_in_background(smtp, mocker):
+    submit = mocker.spy(email_service.email_pool, "submit")
+
+    assert email_service._send_email("Hi", "<p>Hi</p>", "Hi", "to@example.com")
+
+    # the handler doesn't wait for the delivery: the test does
+    assert submit.spy_return.result()
+    server = smtp.return_value
+    server.login.assert_called_once_with("user", "secret")
+    message = server.send_message.call_args.args[0]
+    assert message["To"] == "to@example.com"
+    assert message["Subject"] == "Hi"
+    # the inline logo part is shared by all the emails
+    logo = message.get_payload()[-1]
+    assert logo["Content-ID"] == "<logo_png>"
+    assert logo is email_service._logo_mime()
+
+
+def test_send_email_skipped_in_tests(mocker):
+    submit = mocker.patch.object(email_service.email_pool, "submit")
+    assert not email_service._send_email("Hi", "<p>Hi</p>", "Hi", "to@example.com")
+    submit.assert_not_called()
+
+
+def test_smtp_connection_reused_and_reopened(smtp):
+    connection = email_service.smtp_connection
+    connection.send("first")
+    connection.send("second")
+    # one login for both emails
+    assert smtp.call_count == 1
+    assert smtp.return_value.send_message.call_count == 2
+
+    # the server dropped the idle connection: log in again and resend
+    smtp.return_value.send_message.side_effect = [
+        smtplib.SMTPServerDisconnected(),
+        None,
+    ]
+    connection.send("third")
+    assert smtp.call_count == 2
+    assert smtp.return_value.send_message.call_args.args == ("third",)
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session
+
+from models.auth import User
+from scripts.fetch_data import build_active_users_stmt, fetch_all
+
+
+def test_active_users_filtered_by_the_db(test_session: Session):
+    test_session.add_all(
+        [
+            User(id="active", name="A", email="a@example.com", tokens={"a": "t"}),
+            User(id="none", name="N", email="n@example.com", tokens=None),
+            User(id="empty", name="E", email="e@example.com", tokens={}),
+        ]
+    )
+    test_session.commit()
+
+    users = test_session.exec(build_active_users_stmt()).all()
+    assert [u.id for u in users] == ["active"]
+
+
+@pytest.fixture
+def fetch_env(test_session: Session, mocker):
+    """fetch_all wired to the test session and to fake Spotify clients"""
+
+    @contextmanager
+    def _get_db():
+        yield test_session
+
+    mocker.patch("scripts.fetch_data.get_db", _get_db)
+    mocker.patch("scripts.fetch_data.Spotify")
+    http_client = mocker.patch("scripts.fetch_data.new_http_client")
+    http_client.return_value.aclose = mocker.AsyncMock()
+    return test_session
+
+
+async def test_fetch_all_bounds_concurrency(fetch_env, mocker, caplog):
+    fetch_env.add_all(
+        [
+            User(id=f"u{i}", name="U", email=f"u{i}@example.com", tokens={"a": "t"})
+            for i in range(6)
+        ]
+    )
+    fetch_env.commit()
+
+    running = 0
+    peak = 0
+    processed = []
+
+    async def _process_user(session, user, spotify):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        processed.append(user.id)
+        if user.id == "u3":
+            raise RuntimeError("boom")
+
+    mocker.patch("scripts.fetch_data.process_user", _process_user)
+    with caplog.at_level(logging.ERROR, logger="lykd.fetch"):
+        await fetch_all(max_concurrency=2)
+
+    assert sorted(processed) == [f"u{i}" for i in range(6)]
+    assert peak == 2
+    assert "Error processing user u3@example.com: boom" in caplog.text
+
+
+async def test_fetch_all_stops_on_database_errors(fetch_env, mocker, caplog):
+    fetch_env.add_all(
+        [
+            User(id=f"u{i}", name="U", email=f"u{i}@example.com", tokens={"a": "t"})
+            for i in range(6)
+        ]
+    )
+    fetch_env.commit()
+
+    processed = []
+
+    async def _process_user(session, user, spotify):
+        processed.append(user.id)
+        await asyncio.sleep(0.01)
+        raise OperationalError("UPDATE", {}, Exception("database is locked"))
+
+    mocker.patch("scripts.fetch_data.process_user", _process_user)
+    with caplog.at_level(logging.INFO, logger="lykd.fetch"):
+        with pytest.raises(OperationalError):
+            await fetch_all(max_concurrency=2)
+
+    assert "Stopping the run, database error" in caplog.text
+    # the API usage is reported all the same
+    assert "Spotify API calls made by LYKD" in caplog.text
+    # the other worker is cancelled: the remaining users aren't attempted
+    assert len(processed) == 2
@@ -2,9 +2,12 @@ import pytest
 from sqlmodel import Session
 
 from models.auth import User
+from models.friendship import Friendship
 from services.friendship import (
     request_friendship,
     accept_friendship,
+    decline_friendship,
+    unfriend,
 )
 
 
@@ -32,3 +35,38 @@ def test_only_recipient_can_accept(test_session: Session, users):
     # u2 (recipient) can accept
     fr2 = accept_friendship(test_session, requester=u2, recipient=u1)
     assert fr2.status.value == "accepted"
+
+
+def test_request_reopens_declined(test_session: Session, users):
+    u1, u2 = users
+    request_friendship(test_session, requester=u1, recipient=u2)
+    with pytest.raises(ValueError, match="already pending"):
+        request_friendship(test_session, requester=u2, recipient=u1)
+
+    declined = decline_friendship(test_session, requester=u2, recipient=u1)
+    assert declined.status.value == "declined"
+    assert declined.responded_at is not None
+    with pytest.raises(ValueError, match="No pending request"):
+        decline_friendship(test_session, requester=u2, recipient=u1)
+
+    # a declined request can be sent again, even the other way round
+    fr = request_friendship(test_session, requester=u2, recipient=u1)
+    assert fr.status.value == "pending"
+    assert fr.requested_by_id == u2.id
+    assert fr.responded_at is None
+
+    accept_friendship(test_session, requester=u1, recipient=u2)
+    with pytest.raises(ValueError, match="already friends"):
+        request_friendship(test_session, requester=u1, recipient=u2)
+
+
+def test_unfriend_only_friends(test_session: Session, users):
+    u1, u2 = users
+    request_friendship(test_session, requester=u1, recipient=u2)
+    with pytest.raises(ValueError):
+        unfriend(test_session, user_id=u1.id, other_id=u2.id)
+
+    accept_friendship(test_session, requester=u2, recipient=u1)
+    unfriend(test_session, user_id=u2.id, other_id=u1.id)
+    test_session.expire_all()
+    assert test_session.get(Friendship, (u1.id, u2.id)) is None
@@ -0,0 +1,63 @@
+import datetime
+
+from sqlmodel import Session, select
+
+from models.music import Play, Track
+from services.likes import process_plays
+
+
+def _play(track_id: str, played_at: str) -> dict:
+    return {
+        "played_at": played_at,
+        "context": {"uri": "spotify:playlist:p1"},
+        "track": {
+            "id": track_id,
+            "name": track_id.upper(),
+            "duration_ms": 1000,
+            "uri": f"spotify:track:{track_id}",
+        },
+    }
+
+
+async def test_process_plays_stops_at_known_play(
+    test_session: Session, test_user, mocker
+):
+    test_session.add(Track(id="t0", title="T0", duration=1000))
+    test_session.add(
+        Play(
+            user_id=test_user.id,
+            track_id="t0",
+            date=datetime.datetime(2024, 1, 1, 10, 0, tzinfo=datetime.timezone.utc),
+        )
+    )
+    test_session.commit()
+    pages = [
+        {
+            "items": [
+                _play("t2", "2024-01-01T12:00:00.000Z"),
+                _play("t1", "2024-01-01T11:00:00.000Z"),
+            ],
+            "next": "page2",
+        },
+        {
+            "items": [
+                _play("t0", "2024-01-01T10:00:00.000Z"),  # already stored
+                _play("old", "2024-01-01T09:00:00.000Z"),
+            ],
+            "next": "page3",
+        },
+    ]
+    spotify = mocker.Mock()
+    spotify.get_recently_played_page = mocker.AsyncMock(side_effect=pages)
+    # the real pagination, on the mocked pages
+    from services.spotify import Spotify
+
+    spotify.yield_from = Spotify.yield_from
+    mocker.patch("services.likes.PLAYS_BATCH_SIZE", 2)
+
+    await process_plays(test_session, spotify, test_user)
+
+    plays = test_session.exec(select(Play.track_id).order_by(Play.date)).all()
+    assert plays == ["t0", "t1", "t2"]
+    assert spotify.get_recently_played_page.await_count == 2
+    assert test_session.get(Track, "t2").title == "T2"
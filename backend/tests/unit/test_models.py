@@ -2,7 +2,13 @@
 
 import pytest
 import datetime
-from models.auth import User
+from models.auth import (
+    OAuthState,
+    User,
+    hash_oauth_state,
+    populate_username,
+    purge_expired_oauth_states,
+)
 from models.music import Artist, Track, Album, Play, Like
 
 
@@ -65,6 +71,44 @@ class TestUserModel:
         assert user.is_admin is True
 
 
+def test_populate_username_with_taken_set(test_session):
+    taken = {"john"}
+    users = [User(id=f"u{i}", name="John Doe", email=f"j{i}@x.com") for i in range(2)]
+    assert [populate_username(test_session, u, taken) for u in users] == [
+        "john#2",
+        "john#3",
+    ]
+    assert taken == {"john", "john#2", "john#3"}
+
+
+def test_hash_oauth_state_is_stable_64_char_hex():
+    digest = hash_oauth_state("some-state")
+    assert digest == hash_oauth_state("some-state")
+    assert digest != hash_oauth_state("other-state")
+    assert len(digest) == 64
+
+
+def test_purge_expired_oauth_states(test_session):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    test_session.add_all(
+        [
+            OAuthState(
+                state_hash="live", expires_at=now + datetime.timedelta(minutes=5)
+            ),
+            OAuthState(
+                state_hash="recent", expires_at=now - datetime.timedelta(hours=1)
+            ),
+            OAuthState(state_hash="old", expires_at=now - datetime.timedelta(days=2)),
+        ]
+    )
+    test_session.commit()
+
+    assert purge_expired_oauth_states(test_session) == 1
+    test_session.commit()
+    remaining = {s.state_hash for s in test_session.query(OAuthState).all()}
+    assert remaining == {"live", "recent"}
+
+
 class TestMusicModels:
     """Test music-related models."""
 
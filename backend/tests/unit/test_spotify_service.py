@@ -1,5 +1,7 @@
 """Unit tests for Spotify service with mocked API calls using pytest-httpx."""
 
+import asyncio
+
 import pytest
 from unittest.mock import patch
 from fastapi import HTTPException
@@ -7,7 +9,7 @@ from sqlmodel import Session
 
 import settings
 from models.auth import User
-from services.spotify import Spotify
+from services.spotify import RequestThrottle, Spotify
 
 
 def get_test_user(
@@ -143,14 +145,14 @@ class TestSpotifyService:
         first_page = {
             "items": [{"track": {"id": "track1", "name": "Song 1"}}],
             "next": second_page_url,
-            "total": 100,
+            "total": 2,
         }
 
         # Second page
         second_page = {
             "items": [{"track": {"id": "track2", "name": "Song 2"}}],
             "next": None,
-            "total": 100,
+            "total": 2,
         }
 
         # Mock both requests
@@ -179,6 +181,35 @@ class TestSpotifyService:
         assert result[0]["track"]["id"] == "track1"
         assert result[1]["track"]["id"] == "track2"
 
+    async def test_get_all_fetches_following_pages_by_offset(
+        self, spotify_service, httpx_mock, test_session: Session
+    ):
+        """Pages after the first are requested by offset, results keep order."""
+        base = "https://api.spotify.com/v1/me/tracks"
+
+        def page(offset, ids):
+            return {
+                "items": [{"track": {"id": i}} for i in ids],
+                "next": f"{base}?offset={offset + 2}&limit=2",
+                "limit": 2,
+                "total": 5,
+            }
+
+        httpx_mock.add_response(url=f"{base}?limit=2", json=page(0, ["t1", "t2"]))
+        httpx_mock.add_response(
+            url=f"{base}?offset=2&limit=2", json=page(2, ["t3", "t4"])
+        )
+        httpx_mock.add_response(url=f"{base}?offset=4&limit=2", json=page(4, ["t5"]))
+
+        result = await spotify_service.get_all(
+            user=get_test_user(),
+            db_session=test_session,
+            request=spotify_service.get_liked_page,
+            limit=2,
+        )
+
+        assert [r["track"]["id"] for r in result] == ["t1", "t2", "t3", "t4", "t5"]
+
     async def test_refresh_token_success(self, spotify_service, httpx_mock):
         """Test successful token refresh."""
         new_token_data = {
@@ -273,3 +304,27 @@ class TestSpotifyService:
             await spotify_service.get_user_info("test_token")
 
         assert exc_info.value.status_code == status_code
+
+
+async def test_request_throttle_spaces_requests():
+    throttle = RequestThrottle(rate=20)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    for _ in range(3):
+        await throttle.wait()
+    # the first goes right away, the next two wait a 1/20s slot each
+    assert loop.time() - start >= 0.1
+
+    throttle.pause(0.1)
+    start = loop.time()
+    await throttle.wait()
+    assert loop.time() - start >= 0.1
+
+
+async def test_disabled_request_throttle_never_waits():
+    throttle = RequestThrottle(rate=0)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    for _ in range(100):
+        await throttle.wait()
+    assert loop.time() - start < 0.05
@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlmodel import Session
+
+from models.auth import User
+from models.music import Like, Play, Track
+from routes.spotify_route import build_spotify_stats_stmt
+from tests.unit.test_public_route_query_plans import (
+    _assert_no_full_scan_on,
+    _assert_uses_index_on,
+    _explain_query_plan,
+)
+
+
+def test_spotify_stats_uses_indexes(test_session: Session):
+    details = _explain_query_plan(build_spotify_stats_stmt("u1"), test_session)
+    _assert_no_full_scan_on("likes", details)
+    _assert_no_full_scan_on("plays", details)
+    _assert_uses_index_on("likes", details)
+    _assert_uses_index_on("plays", details)
+    assert any("idx_plays_user_date" in d for d in details), details
+
+
+def test_spotify_stats_counts_each_user(test_session: Session):
+    now = datetime.now(timezone.utc)
+    test_session.add_all(
+        [
+            User(id="u1", name="U1", email="u1@example.com"),
+            User(id="u2", name="U2", email="u2@example.com"),
+            Track(id="t1", title="T1", duration=1000),
+            Like(user_id="u1", track_id="t1", date=now),
+            Play(user_id="u1", track_id="t1", date=now),
+            Play(user_id="u1", track_id="t1", date=now - timedelta(days=1)),
+        ]
+    )
+    test_session.commit()
+
+    for user_id, likes, plays in (("u1", 1, 2), ("u2", 0, 0)):
+        row = test_session.exec(build_spotify_stats_stmt(user_id)).one()
+        assert row[:2] == (likes, plays)
+    assert row[2] is None
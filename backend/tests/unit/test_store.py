@@ -0,0 +1,93 @@
+import datetime
+
+from sqlmodel import Session, select
+
+from models.music import Album, AlbumArtist, Artist, Like, Track, TrackArtist
+from services.store import store_tracks, update_likes_db
+
+
+def _track(track_id: str, name: str, album_id: str = "al1") -> dict:
+    return {
+        "id": track_id,
+        "name": name,
+        "duration_ms": 1000,
+        "uri": f"spotify:track:{track_id}",
+        "artists": [
+            {"id": "ar1", "name": "Artist 1", "uri": "spotify:artist:ar1"},
+            {"id": "bad"},  # skipped: no name
+        ],
+        "album": {
+            "id": album_id,
+            "name": f"Album {album_id}",
+            "release_date": "2020-05-01",
+            "release_date_precision": "day",
+            "images": [{"url": "http://img"}],
+            "artists": [{"id": "ar2", "name": "Artist 2"}],
+        },
+    }
+
+
+def test_store_tracks(test_session: Session):
+    store_tracks(
+        [
+            _track("t1", "One"),
+            _track("t2", "Two"),
+            {"id": "broken"},  # skipped: missing fields
+        ],
+        test_session,
+    )
+    test_session.commit()
+
+    tracks = test_session.exec(select(Track).order_by(Track.id)).all()
+    assert [(t.id, t.title, t.album_id) for t in tracks] == [
+        ("t1", "One", "al1"),
+        ("t2", "Two", "al1"),
+    ]
+    album = test_session.get(Album, "al1")
+    assert album.release_date == datetime.date(2020, 5, 1)
+    assert album.picture == "http://img"
+    assert {a.id for a in test_session.exec(select(Artist))} == {"ar1", "ar2"}
+    assert {
+        (ta.track_id, ta.artist_id) for ta in test_session.exec(select(TrackArtist))
+    } == {("t1", "ar1"), ("t2", "ar1")}
+    assert [
+        (aa.album_id, aa.artist_id) for aa in test_session.exec(select(AlbumArtist))
+    ] == [("al1", "ar2")]
+
+
+def test_store_tracks_updates_existing(test_session: Session):
+    store_tracks([_track("t1", "One")], test_session)
+    test_session.commit()
+
+    store_tracks([_track("t1", "Renamed", album_id="al2")], test_session)
+    test_session.commit()
+    test_session.expire_all()
+
+    track = test_session.get(Track, "t1")
+    assert (track.title, track.album_id) == ("Renamed", "al2")
+    assert len(test_session.exec(select(TrackArtist)).all()) == 1
+
+
+def test_update_likes_db(test_session: Session, test_user):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    store_tracks([_track("t1", "One"), _track("t2", "Two")], test_session)
+    update_likes_db(
+        test_user,
+        likes_to_add=[
+            Like(user_id=test_user.id, track_id="t1", date=now),
+            Like(user_id=test_user.id, track_id="t2", date=now),
+        ],
+        tracks_to_remove=set(),
+        db=test_session,
+    )
+    test_session.commit()
+
+    update_likes_db(
+        test_user,
+        likes_to_add=[Like(user_id=test_user.id, track_id="t2", date=now)],
+        tracks_to_remove={"t1"},
+        db=test_session,
+    )
+    test_session.commit()
+    likes = test_session.exec(select(Like.track_id)).all()
+    assert likes == ["t2"]
@@ -1,3 +1,7 @@
+import itertools
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator
+
+
 def reverse_block_chunks(haystack: list | tuple | set, size):
     """iterate through the list with a given size so the blocks keep their inner order,
     but we get them from the latest"""
@@ -7,3 +11,22 @@ def reverse_block_chunks(haystack: list | tuple | set, size):
     while end > 0:
         yield haystack[start:end]
         start, end = max(0, start - size), start
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    """iterate through any iterable in lists of up to size items, in order"""
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+async def abatched(aiterable: AsyncIterable, size: int) -> AsyncIterator[list]:
+    """like chunked, for async iterables: the last list can be shorter"""
+    batch = []
+    async for item in aiterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -1,4 +1,5 @@
 import datetime
+import functools
 
 ALLOWED_DATETIME_FORMATS = (
     "%Y-%m-%d %H:%M:%S.%f",
@@ -11,6 +12,9 @@ ALLOWED_DATETIME_FORMATS = (
 )
 
 
+# the same timestamps come up again and again (the likes added together,
+# the album release dates): parsing with strptime is slow
+@functools.lru_cache(maxsize=8192)
 def parse_date(date_str) -> datetime.datetime:
     if isinstance(date_str, str):
         if len(date_str) == 4: